@@ -1,7 +1,7 @@
-import pyvisa
+from PooledDriver import PooledDriver
 
 
-class BNC845M:
+class BNC845M(PooledDriver):
     def __init__(self, resource_name):
         """
         Initialize the BNC 845-M instrument.
@@ -9,9 +9,8 @@ class BNC845M:
         Args:
             resource_name (str): VISA resource name (e.g., 'TCPIP0::192.168.141.71::inst0::INSTR')
         """
-        self.rm = pyvisa.ResourceManager()
-        self.instrument = self.rm.open_resource(resource_name)
-        self.instrument.timeout = 5000  # Set a reasonable timeout (in milliseconds)
+        self.resource_name = resource_name
+        self.connect(resource_name, timeout=5000)  # Set a reasonable timeout (in milliseconds)
 
     def identify(self):
         """Query and print the instrument identification."""
@@ -25,21 +24,28 @@ class BNC845M:
         Args:
             frequency_hz (float): Frequency in Hz
         """
-        self.instrument.write(f":FREQ:CW {frequency_hz} Hz")
+        if not self.state.is_current('frequency', frequency_hz):
+            self.instrument.write(f":FREQ:CW {frequency_hz} Hz")
+            self.state.update('frequency', frequency_hz)
         print(f"Synth frequency set to {frequency_hz} Hz")
 
     def set_power_level(self, power_level):
         """Set the output power level in dBm."""
-        self.instrument.write(f":POWer:LEVel {power_level}")
+        if not self.state.is_current('power_level', power_level):
+            self.instrument.write(f":POWer:LEVel {power_level}")
+            self.state.update('power_level', power_level)
 
     def start_output(self):
         """Start the output signal."""
-        self.instrument.write(":OUTP ON")
+        if not self.state.is_current('output', 'ON'):
+            self.instrument.write(":OUTP ON")
+            self.state.update('output', 'ON')
         print("Synth output started")
 
     def stop_output(self):
         """Stop the output signal."""
-        self.instrument.write(":OUTP OFF")
+        self.instrument.write(":OUTP OFF")  # always sent, switching off must not depend on the cache
+        self.state.update('output', 'OFF')
         print("Synth output stopped")
 
     def validate_output(self):
@@ -51,9 +57,6 @@ class BNC845M:
         print(f"Current synth frequency: {freq} Hz")
         print(f"Synth output status: {output_status.strip()}")
 
-    def close(self):
-        """Close the instrument connection."""
-        self.instrument.close()
 
 
 # Example usage:
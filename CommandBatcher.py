@@ -0,0 +1,122 @@
+import re
+from contextlib import contextmanager
+
+# Commands after which the instrument settings are unknown; each SCPI node matches in short or long form
+RESET_COMMAND = re.compile(r':?(\*RST|\*RCL|RECA(LL)?\b|FAC(TORY)?\b|SYST(EM)?:PRES(ET)?\b)', re.IGNORECASE)
+
+
+class CommandBatcher:
+    def __init__(self, session, max_length=1024, state=None):
+        """
+        Wrap an instrument session so that writes can be coalesced into one SCPI program message.
+
+        Outside a batch every call goes straight to the session. Inside a batch, writes are
+        queued and sent as a single semicolon-joined message when the batch ends or when the
+        next query or read needs them on the wire. Any other attribute (timeout, close,
+        read_termination, ...) is forwarded to the wrapped session.
+
+        Args:
+            session: pyvisa resource or SocketTransport with write() and query()
+            max_length (int): Longest program message sent at once, longer batches are split
+            state (StateCache): Driver state cache, invalidated on resets, discarded batches and I/O errors
+        """
+        self.__dict__.update(session=session, max_length=max_length, pending=[], depth=0, sync_requested=False,
+                             state=state)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            setattr(self.session, name, value)
+
+    def invalidate_state(self):
+        if self.state is not None:
+            self.state.invalidate()
+
+    def reconnect(self, session):
+        """Swap in a freshly opened session, after which the instrument state is unknown."""
+        self.session = session
+        self.pending.clear()
+        self.invalidate_state()
+
+    def send(self, method, message):
+        """Call session.write or session.query, dropping the cached state if the call fails."""
+        if any(RESET_COMMAND.match(command.strip()) for command in message.split(';')):
+            self.invalidate_state()
+        try:
+            return getattr(self.session, method)(message)
+        except BaseException:
+            self.invalidate_state()  # a partially applied message leaves the settings unknown
+            raise
+
+    @staticmethod
+    def join(commands):
+        """Join commands into one program message, re-rooting each header with ':'."""
+        return ';'.join(command if command.startswith('*') else ':' + command.lstrip(':') for command in commands)
+
+    def messages(self, commands):
+        """Split commands into program messages no longer than max_length."""
+        message = []
+        for command in commands:
+            if message and len(self.join(message + [command])) > self.max_length:
+                yield self.join(message)
+                message = []
+            message.append(command)
+        if message:
+            yield self.join(message)
+
+    @contextmanager
+    def batch(self, sync=False):
+        """
+        Queue writes until the outermost batch exits, then flush them.
+
+        Args:
+            sync (bool): Append a single *OPC? to the flushed message and wait for it
+        """
+        self.depth += 1
+        self.sync_requested = self.sync_requested or sync
+        try:
+            yield self
+        except BaseException:
+            self.depth -= 1
+            if self.depth == 0:
+                self.pending.clear()  # never send half of a failed batch
+                self.sync_requested = False
+                self.invalidate_state()  # cached values written inside the batch never reached the instrument
+            raise
+        self.depth -= 1
+        if self.depth == 0:
+            sync, self.sync_requested = self.sync_requested, False
+            self.flush(sync)
+
+    def flush(self, sync=False):
+        """Send all queued writes, optionally followed by one *OPC? round trip."""
+        commands, self.pending = self.pending, []
+        if sync:
+            commands.append('*OPC?')
+        messages = list(self.messages(commands))
+        for message in messages[:-1]:
+            self.send('write', message)
+        if messages:
+            self.send('query' if sync else 'write', messages[-1])
+
+    def write(self, command):
+        if self.depth:
+            self.pending.append(command)
+        else:
+            self.send('write', command)
+
+    def query(self, command):
+        """Send a query, carrying any queued writes in the same program message."""
+        commands, self.pending = self.pending + [command], []
+        messages = list(self.messages(commands))
+        for message in messages[:-1]:
+            self.send('write', message)
+        return self.send('query', messages[-1])
+
+    def read_bytes(self, *args, **kwargs):
+        self.flush()
+        return self.session.read_bytes(*args, **kwargs)
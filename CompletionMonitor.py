@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from CommandBatcher import CommandBatcher
+
+# Standard event status register bits that indicate a failed operation
+ESR_OPC = 0x01
+ESR_ERRORS = {0x04: 'query error', 0x08: 'device error', 0x10: 'execution error', 0x20: 'command error'}
+
+
+class OperationError(Exception):
+    """an instrument reported an error in its event status register"""
+    pass
+
+
+class CompletionMonitor:
+    def __init__(self, poll_interval=0.01, max_interval=0.5):
+        """
+        Track long instrument operations as futures instead of blocking on *OPC?.
+
+        Operations are started with '<command>;*OPC' and completion is detected from the
+        OPC bit of the standard event status register, either by polling *ESR? with
+        exponential backoff from one background thread or by waiting for a service
+        request. Futures from several instruments can be combined with
+        concurrent.futures.wait(). A session must not be used by other threads while
+        one of its operations is pending.
+
+        Args:
+            poll_interval (float): First polling delay in seconds
+            max_interval (float): Longest polling delay in seconds
+        """
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.pending = []
+        self.lock = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.poll_loop, name='CompletionMonitor', daemon=True)
+        self.thread.start()
+
+    def watch(self, session, command=None, use_srq=False, timeout=60):
+        """
+        Start an operation and return a future that resolves with the final *ESR? value.
+
+        Args:
+            session: Instrument session (CommandBatcher, pyvisa resource or SocketTransport)
+            command (str): Operation to start, or None to wait for operations already pending
+            use_srq (bool): Wait for a service request (needs session.wait_for_srq) instead of polling
+            timeout (float): Seconds before the future fails with TimeoutError
+
+        Returns:
+            Future: Resolves to the ESR value, or raises OperationError/TimeoutError
+        """
+        commands = ['*ESR?'] if command is None else ['*ESR?', command]  # *ESR? first clears stale OPC bits
+        if use_srq and hasattr(session, 'wait_for_srq'):
+            enables = session.query('*ESE?;*SRE?').strip().split(';')  # restored once the request is served
+            commands = ['*ESE 1', '*SRE 32'] + commands  # OPC -> ESB -> service request
+        session.query(CommandBatcher.join(commands + ['*OPC']))
+        future = Future()
+        future.set_running_or_notify_cancel()
+        if use_srq and hasattr(session, 'wait_for_srq'):
+            threading.Thread(target=self.wait_srq, args=(future, session, timeout, enables), daemon=True).start()
+        else:
+            self.add(future, lambda: self.check_esr(session), timeout)
+        return future
+
+    def watch_condition(self, check, timeout=60):
+        """
+        Return a future that resolves with the first truthy result of check(), polled with backoff.
+
+        Args:
+            check (callable): Returns a falsy value while the operation is still running
+            timeout (float): Seconds before the future fails with TimeoutError
+        """
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.add(future, check, timeout)
+        return future
+
+    @staticmethod
+    def check_esr(session):
+        esr = int(session.query('*ESR?'))
+        errors = [name for bit, name in ESR_ERRORS.items() if esr & bit]
+        if errors:
+            raise OperationError(f"Operation failed: {', '.join(errors)} (ESR={esr})")
+        return esr if esr & ESR_OPC else None
+
+    def wait_srq(self, future, session, timeout, enables):
+        try:
+            try:
+                session.wait_for_srq(int(timeout * 1000))
+                session.read_stb()  # serial poll clears the request; *STB? would not
+            finally:
+                session.write(f'*ESE {int(enables[0])};*SRE {int(enables[1])}')
+            future.set_result(self.check_esr(session))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def add(self, future, check, timeout):
+        with self.lock:
+            now = time.monotonic()
+            self.pending.append({'future': future, 'check': check, 'deadline': now + timeout,
+                                 'next_poll': now, 'interval': self.poll_interval})
+            self.lock.notify()
+
+    def poll_loop(self):
+        while True:
+            with self.lock:
+                while self.running and not self.pending:
+                    self.lock.wait()
+                if not self.running:
+                    return
+                now = time.monotonic()
+                due = [op for op in self.pending if op['next_poll'] <= now]
+                if not due:
+                    self.lock.wait(min(op['next_poll'] for op in self.pending) - now)
+                    continue
+            for op in due:
+                result, error = None, None
+                try:
+                    result = op['check']()
+                    if not result and time.monotonic() > op['deadline']:
+                        error = TimeoutError("Operation did not complete in time")
+                except BaseException as e:
+                    error = e
+                with self.lock:
+                    if op['future'].done():  # failed by shutdown() while polling
+                        continue
+                    if error is not None:
+                        op['future'].set_exception(error)
+                    elif result:
+                        op['future'].set_result(result)
+                    else:
+                        op['interval'] = min(op['interval'] * 2, self.max_interval)
+                        op['next_poll'] = time.monotonic() + op['interval']
+                        continue
+                    self.pending.remove(op)
+
+    def shutdown(self):
+        """Stop the polling thread; operations still pending are cancelled."""
+        with self.lock:
+            self.running = False
+            for op in self.pending:
+                op['future'].set_exception(TimeoutError("Completion monitor shut down"))
+            self.pending.clear()
+            self.lock.notify()
+        self.thread.join()
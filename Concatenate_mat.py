@@ -1,38 +1,159 @@
 import os
+import time
 import numpy as np
-from scipy.io import loadmat, savemat
 from datetime import datetime
 
+# scipy.io and h5py (for MAT v7.3 files) are imported by the functions that use them
 
-def combine_mat_files(root_dir, filenames, output_name):
+# Largest variable savemat can write in a MAT v5 file
+MAT5_LIMIT = 2 ** 31
+
+# An HDF5 file starts with this signature, after a user block of 0, 512, 1024, ... bytes
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+# MATLAB class names of numpy types, stored as the MATLAB_class attribute of v7.3 variables
+MATLAB_CLASSES = {'float64': 'double', 'float32': 'single', 'int8': 'int8', 'int16': 'int16', 'int32': 'int32',
+                  'int64': 'int64', 'uint8': 'uint8', 'uint16': 'uint16', 'uint32': 'uint32', 'uint64': 'uint64',
+                  'bool': 'logical'}
+
+
+# Each input "data" field holds one channel per column, (samples, k) as loadmat returns it.
+# Combined files hold one channel per row, (channels, samples), as the original np.vstack did;
+# HDF5 stores MATLAB arrays transposed, so in a v7.3 file that is a (samples, channels) dataset.
+
+def is_mat73(filename):
+    """True if filename is a MAT v7.3 (HDF5) file."""
+    with open(filename, 'rb') as f:
+        for offset in (0, 512, 1024, 2048):
+            f.seek(offset)
+            if f.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE:
+                return True
+    return False
+
+
+def channel_shape(filename):
+    """
+    Shape and type of the "data" field of a .mat file, without loading it.
+
+    Returns:
+        tuple: (shape as loadmat would return it, numpy dtype), or None if there is no "data" field
+    """
+    if is_mat73(filename):
+        import h5py
+        with h5py.File(filename, 'r') as f:
+            if 'data' not in f:
+                return None
+            return f['data'].shape[::-1], f['data'].dtype  # HDF5 stores MATLAB arrays transposed
+    from scipy.io import whosmat
+    for name, shape, matlab_class in whosmat(filename):
+        if name == 'data':
+            dtypes = {value: key for key, value in MATLAB_CLASSES.items()}
+            return shape, np.dtype(dtypes.get(matlab_class, 'float64'))
+    return None
+
+
+def copy_channel(filename, dataset, column, chunk_size=1 << 22):
+    """
+    Copy the "data" field of one .mat file into a combined "data" as channels column, column + 1, ...
+
+    The destination is a v7.3 "data" dataset or a numpy array, both (samples, channels)
+    in storage order, i.e. one channel per row in MATLAB. v7.3 inputs are copied chunk
+    by chunk; older .mat files have to be loaded whole.
+
+    Returns:
+        dict: The other fields of the file (header information)
+    """
+    if is_mat73(filename):
+        import h5py
+        with h5py.File(filename, 'r') as f:
+            source = f['data']  # (k, samples) on disk is loadmat's (samples, k)
+            for start in range(0, source.shape[1], chunk_size):
+                block = source[:, start:start + chunk_size]
+                dataset[start:start + block.shape[1], column:column + block.shape[0]] = block.T
+            fields = {}
+            for key, item in f.items():
+                if key == 'data' or not isinstance(item, h5py.Dataset):
+                    continue
+                if item.attrs.get('MATLAB_class') == b'char':
+                    fields[key] = item[()].astype(np.uint16).tobytes().decode('utf-16-le')
+                else:
+                    fields[key] = np.asarray(item[()]).T  # back to loadmat's orientation
+            return fields
+    from scipy.io import loadmat
+    mat_contents = loadmat(filename)
+    data = mat_contents["data"]
+    dataset[:, column:column + data.shape[1]] = data
+    return {key: value for key, value in mat_contents.items() if key != "data"}
+
+
+def write_variable(f, name, value):
+    # Store a header field as a MATLAB v7.3 variable
+    if name.startswith('_'):
+        return  # loadmat's __header__, __version__ and __globals__
+    if isinstance(value, str) or (isinstance(value, np.ndarray) and value.dtype.kind == 'U'):
+        text = ''.join(np.atleast_1d(value).tolist()) if isinstance(value, np.ndarray) else value
+        dataset = f.create_dataset(name, data=np.frombuffer(text.encode('utf-16-le'), dtype=np.uint16)[:, None])
+        dataset.attrs['MATLAB_class'] = np.bytes_('char')
+        return
+    value = np.asarray(value)
+    if value.dtype.name not in MATLAB_CLASSES:
+        print(f"Warning: header field '{name}' of type {value.dtype} not supported in v7.3 output. Skipping.")
+        return
+    dataset = f.create_dataset(name, data=np.atleast_2d(value).T)
+    dataset.attrs['MATLAB_class'] = np.bytes_(MATLAB_CLASSES[value.dtype.name])
+
+
+def write_mat73_header(path):
+    # The 128-byte text header MATLAB looks for in the HDF5 user block of a v7.3 file
+    text = (f"MATLAB 7.3 MAT-file, Platform: PCWIN64, "
+            f"Created on: {time.strftime('%a %b %d %H:%M:%S %Y')} HDF5 schema 1.00 .")
+    header = text.ljust(116).encode('ascii') + bytes(8) + b'\x00\x02IM'
+    with open(path, 'r+b') as f:
+        f.write(header)
+
+
+def combine_mat_files(root_dir, filenames, output_name, chunk_size=1 << 22, mat73=None):
     """
     Combines "data" field from multiple .mat files into a single file.
 
+    The channels of all files become the rows of one (channels, samples) "data"
+    field. By default the output is a MAT v5 file written with savemat, which
+    scipy.io.loadmat (and MatViewer) can read; the channels are copied into one
+    preallocated array first. A MAT v7.3 (HDF5) file is written instead when asked
+    for, or when the data exceeds the 2 GB per-variable limit of savemat: the
+    combined "data" is then preallocated as a chunked dataset and each file is copied
+    into it and released before the next one is read, so only one channel is in
+    memory at a time. v7.3 files can be extended later with append_mat_files().
+
     Args:
         root_dir (str): Root directory containing the .mat files.
         filenames (list): List of filenames (without extension).
         output_name (str): Name of the output file (without extension).
-    """
-    # Initialize empty list to store combined data
-    combined_data = []
-
-    # Initialize header information dictionary
-    header_info = {}
+        chunk_size (int): Samples copied per block from v7.3 inputs.
+        mat73 (bool): True for v7.3 output, False for v5, None to use v7.3 only above the v5 limit.
 
+    Returns:
+        str: Path of the combined file
+    """
     # Construct full file paths
     full_filenames = [os.path.join(root_dir, f"{filename}.mat") for filename in filenames]
 
-    # Iterate through filenames and accumulate data
+    # Find the size of every "data" field first so the output can be allocated once
+    shapes = {}
     for filename in full_filenames:
-        try:
-            mat_contents = loadmat(filename)  # Load .mat file
-            data = np.transpose(mat_contents["data"])  # Load "data" field
-            combined_data.append(data)
-            # Extract header information from the first file
-            if not header_info:
-                header_info = {key: value for key, value in mat_contents.items() if key != "data"}
-        except KeyError:
+        shape = channel_shape(filename)
+        if shape is None:
             print(f"Warning: 'data' field not found in {filename}. Skipping.")
+            continue
+        shapes[filename] = shape
+    if not shapes:
+        raise ValueError("No 'data' fields found")
+    num_samples = next(iter(shapes.values()))[0][0]
+    for filename, (shape, _) in shapes.items():
+        if shape[0] != num_samples:
+            raise ValueError(f"{filename} has {shape[0]} samples, expected {num_samples}")
+    num_channels = sum(shape[1] for shape, _ in shapes.values())
+    dtype = np.result_type(*(dtype for _, dtype in shapes.values()))
 
     # Get the creation time of the first file
     first_file_ctime = os.path.getctime(full_filenames[0])
@@ -42,11 +163,71 @@ def combine_mat_files(root_dir, filenames, output_name):
 
     # Format the creation time as part of the output file name
     output_filename = f"{output_name}_{creation_time_str}.mat"
+    output_path = os.path.join(root_dir, output_filename)
+
+    if mat73 is None:
+        mat73 = num_samples * num_channels * dtype.itemsize >= MAT5_LIMIT
+
+    if not mat73:
+        from scipy.io import savemat
+        # Fill one preallocated array instead of stacking copies; its transpose is (channels, samples)
+        combined = np.empty((num_samples, num_channels), dtype=dtype)
+        header_info, column = {}, 0
+        for filename, (shape, _) in shapes.items():
+            fields = copy_channel(filename, combined, column, chunk_size)
+            column += shape[1]
+            header_info = header_info or fields  # Extract header information from the first file
+        header_info = {key: value for key, value in header_info.items() if not key.startswith('_')}
+        savemat(output_path, {"data": combined.T, **header_info})
+    else:
+        import h5py
+        with h5py.File(output_path, 'w', userblock_size=512) as f:
+            # MATLAB's (channels, samples) "data" is stored as (samples, channels); one chunk per channel run
+            dataset = f.create_dataset('data', shape=(num_samples, num_channels), maxshape=(num_samples, None),
+                                       dtype=dtype, chunks=(min(num_samples, chunk_size), 1))
+            dataset.attrs['MATLAB_class'] = np.bytes_(MATLAB_CLASSES[dtype.name])
+            header_info, column = {}, 0
+            for filename, (shape, _) in shapes.items():
+                fields = copy_channel(filename, dataset, column, chunk_size)
+                column += shape[1]
+                header_info = header_info or fields  # Extract header information from the first file
+            for name, value in header_info.items():
+                write_variable(f, name, value)
+        write_mat73_header(output_path)
 
-    # Save the combined data and header information to a new .mat file
-    savemat(os.path.join(root_dir, output_filename), {"data": np.vstack(combined_data), **header_info})
-    print(f"Combined data saved to: {os.path.join(root_dir, output_filename)}")
-    print(np.vstack(combined_data))
+    print(f"Combined data saved to: {output_path} ({num_channels} channels of {num_samples} samples)")
+    return output_path
+
+
+def append_mat_files(combined_path, root_dir, filenames, chunk_size=1 << 22):
+    """
+    Append the "data" fields of more .mat files as new channels of a combined v7.3 file.
+
+    Args:
+        combined_path (str): MAT v7.3 file written by combine_mat_files().
+        root_dir (str): Root directory containing the .mat files.
+        filenames (list): List of filenames (without extension).
+        chunk_size (int): Samples copied per block from v7.3 inputs.
+
+    Returns:
+        int: Number of channels in the combined file afterwards
+    """
+    import h5py
+    with h5py.File(combined_path, 'r+') as f:
+        dataset = f['data']
+        num_samples = dataset.shape[0]
+        for filename in (os.path.join(root_dir, f"{filename}.mat") for filename in filenames):
+            shape = channel_shape(filename)
+            if shape is None:
+                print(f"Warning: 'data' field not found in {filename}. Skipping.")
+                continue
+            if shape[0][0] != num_samples:
+                raise ValueError(f"{filename} has {shape[0][0]} samples, expected {num_samples}")
+            column = dataset.shape[1]
+            dataset.resize(column + shape[0][1], axis=1)  # new rows of MATLAB's (channels, samples) "data"
+            copy_channel(filename, dataset, column, chunk_size)
+            print(f"Appended {filename} as channel {column + 1}")
+        return dataset.shape[1]
 
 
 # Define filenames (assuming j ranges from 0 to 7)
@@ -1,5 +1,4 @@
 import numpy as np
-import nidaqmx
 
 # Define a lookup table mapping RF and IF combinations to binary values for digital output lines.
 lookup_table = {
@@ -27,55 +26,234 @@ lookup_table = {
     'RF5IF4': (1, 0, 1, 1, 1)
 }
 
+# The same table as one integer per port, bit n driving line n.
+port_masks = {name: sum(bit << line for line, bit in enumerate(values)) for name, values in lookup_table.items()}
+mask_names = {mask: name for name, mask in port_masks.items()}
+
 
 class DIOController:
-    def __init__(self, resource_name):
+    def __init__(self, resource_name, group_by_port=True, backend=None):
+        """
+        Drive the RF/IF switching matrix through the digital output lines of a USB-6509.
+
+        Args:
+            resource_name (str): NI-DAQmx device name (e.g., 'USB-6509')
+            group_by_port (bool): Use one channel per port written as an integer mask,
+                instead of one boolean channel per line
+            backend (module): Provides Task and constants like nidaqmx does, e.g. SimulatedDAQ
+                to run without hardware; defaults to nidaqmx
+        """
+        if backend is None:
+            import nidaqmx  # imported here so that users of lookup_table alone do not load the DAQmx driver
+            import nidaqmx.constants
+            backend = nidaqmx
+        self.backend = backend
+        self.resource_name = resource_name
+
         # Initialize a task for communication with the NI DAQ hardware.
-        self.task = nidaqmx.Task()
+        self.task = backend.Task()
+        self.sequence_task = None  # Buffered task of load_sequence(), if any.
+        self.sequence = None  # Port masks of the loaded sequence, one row per step.
         self.num_ports = 8  # Total number of ports on the DAQ device.
         self.num_lines_per_port = 5  # Number of digital output lines per port.
         self.num_total_lines = self.num_ports * self.num_lines_per_port  # Total number of digital output lines.
-        self.lines = np.zeros(self.num_total_lines, dtype=bool)  # Initialize an array to store line values.
+        self.group_by_port = group_by_port
+        self.port_values = np.zeros(self.num_ports, dtype=np.uint8)  # Line states of each port as a bit mask.
+        self.written = None  # Port masks of the last write, None until the first one.
 
-        # Add digital output channels to the task for each line.
+        if group_by_port:
+            self.add_port_channels(self.task)
+        else:
+            # Add digital output channels to the task for each line.
+            for DIOport in range(self.num_ports):
+                for DIOline in range(self.num_lines_per_port):
+                    self.task.do_channels.add_do_chan(f'{resource_name}/port{DIOport}/line{DIOline}',
+                                                      line_grouping=backend.constants.LineGrouping.CHAN_PER_LINE)
+
+    def add_port_channels(self, task):
+        # One channel per port; lines 0-4 are written together as an unsigned integer.
         for DIOport in range(self.num_ports):
-            for DIOline in range(self.num_lines_per_port):
-                self.task.do_channels.add_do_chan(f'{resource_name}/port{DIOport}/line{DIOline}',
-                                                  line_grouping=nidaqmx.constants.LineGrouping.CHAN_PER_LINE)
+            task.do_channels.add_do_chan(f'{self.resource_name}/port{DIOport}/line0:{self.num_lines_per_port - 1}',
+                                         line_grouping=self.backend.constants.LineGrouping.CHAN_FOR_ALL_LINES)
+
+    @property
+    def lines(self):
+        """Line states as a flat bool array, port by port."""
+        bits = (self.port_values[:, None] >> np.arange(self.num_lines_per_port)) & 1
+        return bits.astype(bool).ravel()
 
     def set_line_value(self, port, line, value):
-        # Calculate the index of the line in the lines array.
-        line_index = port * self.num_lines_per_port + line
-        # Set the value of the line.
-        self.lines[line_index] = value
+        # Set or clear the bit of the line in the port mask.
+        if value:
+            self.port_values[port] |= 1 << line
+        else:
+            self.port_values[port] &= ~np.uint8(1 << line)
 
     def set_rf_if_values(self, rf_if_combination):
-        # Retrieve the binary values corresponding to the given RF and IF combination from the lookup table.
-        if rf_if_combination not in lookup_table:
+        # Retrieve the port mask corresponding to the given RF and IF combination from the lookup table.
+        if rf_if_combination not in port_masks:
             raise ValueError(f"Invalid RF and IF combination: {rf_if_combination}")
-        rf_if_values = lookup_table[rf_if_combination]
-        # Set the line values for all ports based on the RF and IF values.
-        for port in range(self.num_ports):
-            for line, value in enumerate(rf_if_values):
-                self.set_line_value(port, line, value)
+        # Set the same mask on all ports.
+        self.port_values[:] = port_masks[rf_if_combination]
 
     def set_all_ports_rf_if_values(self, rf_if_combination):
         # Set the RF and IF values for all ports using the set_rf_if_values method.
-        for port in range(self.num_ports):
-            self.set_rf_if_values(rf_if_combination)
+        self.set_rf_if_values(rf_if_combination)
+
+    def set_port_routing(self, routing):
+        """
+        Set an RF/IF combination per port, so sub-arrays can be routed to different bands.
+
+        Args:
+            routing (list or dict): One combination per port, or {port: combination};
+                ports given as None or left out of the dict keep their current routing
+        """
+        if isinstance(routing, dict):
+            items = routing.items()
+        elif len(routing) == self.num_ports:
+            items = enumerate(routing)
+        else:
+            raise ValueError(f"Expected {self.num_ports} port routings, got {len(routing)}")
+        masks = self.port_values.copy()
+        for port, rf_if_combination in items:
+            if not 0 <= port < self.num_ports:
+                raise ValueError(f"Invalid port: {port}")
+            if rf_if_combination is None:
+                continue
+            if rf_if_combination not in port_masks:
+                raise ValueError(f"Invalid RF and IF combination for port {port}: {rf_if_combination}")
+            masks[port] = port_masks[rf_if_combination]
+        self.port_values[:] = masks  # nothing changes if any entry is invalid
+
+    def port_routing(self):
+        """RF/IF combination of each port, None where the lines match no lookup_table entry."""
+        return [mask_names.get(int(mask)) for mask in self.port_values]
+
+    def pending_changes(self):
+        """
+        Lines whose state differs from the last write.
+
+        Returns:
+            list: (port, line, value) tuples; every line before the first write
+        """
+        if self.written is None:
+            changed = np.full(self.num_ports, (1 << self.num_lines_per_port) - 1, dtype=np.uint8)
+        else:
+            changed = self.port_values ^ self.written
+        ports, lines = np.nonzero((changed[:, None] >> np.arange(self.num_lines_per_port)) & 1)
+        return [(int(port), int(line), bool(self.port_values[port] >> line & 1)) for port, line in zip(ports, lines)]
+
+    def update_digital_output(self, force=False):
+        """
+        Write the line states to the digital output in one call.
 
-    def update_digital_output(self):
-        # Write the line values to the digital output.
-        self.task.write(self.lines, auto_start=True)
+        Args:
+            force (bool): Write even if the states match the last write
+
+        Returns:
+            bool: True if a write was issued
+        """
+        if not force and not self.pending_changes():
+            return False
+        if self.group_by_port:
+            self.task.write([int(value) for value in self.port_values], auto_start=True)
+        else:
+            self.task.write(self.lines, auto_start=True)
+        self.written = self.port_values.copy()
+        return True
 
     def read_written_values(self):
         # Read the written values from the digital output.
         read_data = self.task.read(number_of_samples_per_channel=1)
+        if self.group_by_port:
+            # Expand the port masks to one value per line, as in per-line mode.
+            masks = [int(np.ravel(value)[0]) for value in read_data]
+            read_data = [bool(mask >> line & 1) for mask in masks for line in range(self.num_lines_per_port)]
         return read_data
 
+    def load_sequence(self, states, rate, clock_source=None, trigger_source=None, falling_edge=False):
+        """
+        Preload switching states into a buffered task that steps through them in hardware.
+
+        Each step is one sample of a finite output buffer, so hops are paced by the sample
+        clock instead of by Python and USB round trips. Needs a device with hardware-timed
+        digital output; static-only devices such as the USB-6509 reject the timing setup.
+
+        Args:
+            states (list): One entry per step, either a lookup_table combination for all
+                ports or a list with one combination per port
+            rate (float): Sample clock rate in Hz; with clock_source, the fastest expected edge rate
+            clock_source (str): Terminal whose edges advance the sequence (e.g., '/Dev1/PFI0'),
+                None for the internal sample clock
+            trigger_source (str): Terminal whose edge starts the sequence, None to start on start_sequence()
+            falling_edge (bool): Use falling instead of rising edges for the clock and trigger
+
+        Returns:
+            numpy.ndarray: Port masks of the sequence, one row per step
+        """
+        if not len(states):
+            raise ValueError("Sequence needs at least one state")
+        sequence = np.empty((len(states), self.num_ports), dtype=np.uint8)
+        for step, state in enumerate(states):
+            routing = [state] * self.num_ports if isinstance(state, str) else list(state)
+            if len(routing) != self.num_ports:
+                raise ValueError(f"Step {step}: expected {self.num_ports} port routings, got {len(routing)}")
+            for port, rf_if_combination in enumerate(routing):
+                if rf_if_combination not in port_masks:
+                    raise ValueError(f"Step {step}: invalid RF and IF combination for port {port}: {rf_if_combination}")
+                sequence[step, port] = port_masks[rf_if_combination]
+
+        self.close_sequence()
+        constants = self.backend.constants
+        edge = constants.Edge.FALLING if falling_edge else constants.Edge.RISING
+        task = self.backend.Task()
+        try:
+            self.add_port_channels(task)
+            task.timing.cfg_samp_clk_timing(rate, source=clock_source or '', active_edge=edge,
+                                            sample_mode=constants.AcquisitionType.FINITE,
+                                            samps_per_chan=len(sequence))
+            if trigger_source:
+                task.triggers.start_trigger.cfg_dig_edge_start_trig(trigger_source, trigger_edge=edge)
+            task.write([[int(mask) for mask in column] for column in sequence.T], auto_start=False)
+        except BaseException:
+            task.close()
+            raise
+        self.sequence_task = task
+        self.sequence = sequence
+        return sequence
+
+    def start_sequence(self):
+        # Arm the loaded sequence; it runs on the sample clock, or after the start trigger if one is set.
+        if self.sequence_task is None:
+            raise RuntimeError("No sequence loaded")
+        self.sequence_task.start()
+
+    def wait_sequence(self, timeout=10.0):
+        """
+        Wait for the loaded sequence to finish and stop its task.
+
+        The lines hold the last step afterwards, which becomes the state that
+        update_digital_output() compares against.
+        """
+        if self.sequence_task is None:
+            raise RuntimeError("No sequence loaded")
+        self.sequence_task.wait_until_done(timeout=timeout)
+        self.sequence_task.stop()
+        self.port_values[:] = self.sequence[-1]
+        self.written = self.sequence[-1].copy()
+
+    def close_sequence(self):
+        # Release the buffered task so the lines can be written on demand again.
+        if self.sequence_task is not None:
+            self.sequence_task.close()
+            self.sequence_task = None
+            self.sequence = None
+
     def close(self):
-        # Close the task.
+        # Close the tasks.
+        self.close_sequence()
         self.task.close()
+        self.written = None
 
 
 # Example usage:
@@ -0,0 +1,159 @@
+import json
+import os
+
+import numpy as np
+from scipy import signal
+
+from FrequencyPlan import intermediate_frequency, set_instrument_parameters
+from wfmReader import read_wfm
+
+
+class DigitalDownconverter:
+    def __init__(self, if_frequency, sample_rate, bandwidth, inverted=False, taps_per_phase=16, oversample=1.25):
+        """
+        Mix a real IF record to complex baseband, low-pass filter and decimate it.
+
+        The filter runs as a polyphase decimator: the input is reshaped into rows of
+        `decimation` samples and each branch is one matrix-vector product, so only
+        the kept output samples are computed. Records can be fed in blocks of any
+        size with process(); the mixer phase and filter history carry over.
+
+        Args:
+            if_frequency (float): Frequency in Hz mixed down to 0 Hz
+            sample_rate (float): Input sample rate in Hz
+            bandwidth (float): Two-sided bandwidth in Hz to keep around the IF
+            inverted (bool): Conjugate the output so it is not mirrored relative to RF
+            taps_per_phase (int): Filter taps per polyphase branch; more gives a sharper filter
+            oversample (float): Output rate relative to bandwidth, sets the decimation factor
+        """
+        self.if_frequency = if_frequency
+        self.sample_rate = sample_rate
+        self.bandwidth = bandwidth
+        self.inverted = inverted
+        self.taps_per_phase = taps_per_phase
+        self.decimation = max(1, int(sample_rate // (bandwidth * oversample)))
+        self.output_rate = sample_rate / self.decimation
+        taps = signal.firwin(taps_per_phase * self.decimation, bandwidth / 2, fs=sample_rate)
+        # Gain of 2 restores the amplitude of a real tone after mixing; rows are the reversed filter per branch
+        self.branches = (2 * taps[::-1]).reshape(taps_per_phase, self.decimation).astype(np.complex64)
+        self.step = 2 * np.pi * if_frequency / sample_rate
+        self.reset()
+
+    def reset(self):
+        """Start a new record: zero the mixer phase and the filter history."""
+        self.phase = 0.0
+        # Output m is then centred like scipy.signal.upfirdn: the filter ends at input sample m * decimation
+        self.history = np.zeros(self.taps_per_phase * self.decimation - 1, dtype=np.complex64)
+
+    def process(self, samples):
+        """
+        Downconvert the next block of a record.
+
+        Args:
+            samples (numpy.ndarray): Real samples in volts
+
+        Returns:
+            numpy.ndarray: complex64 I/Q samples at output_rate; ceil(n / decimation) for a record of n samples
+        """
+        n = len(samples)
+        oscillator = np.exp(-1j * (self.phase + self.step * np.arange(n))).astype(np.complex64)
+        self.phase = (self.phase + self.step * n) % (2 * np.pi)
+        buffer = np.concatenate([self.history, oscillator * np.asarray(samples, dtype=np.float32)])
+
+        rows = len(buffer) // self.decimation
+        count = rows - self.taps_per_phase + 1
+        if count <= 0:
+            self.history = buffer
+            return np.empty(0, dtype=np.complex64)
+        blocks = buffer[:rows * self.decimation].reshape(rows, self.decimation)
+        out = blocks[:count] @ self.branches[0]
+        for branch in range(1, self.taps_per_phase):
+            out += blocks[branch:branch + count] @ self.branches[branch]
+        self.history = buffer[count * self.decimation:]
+        return np.conj(out, out=out) if self.inverted else out
+
+    def downconvert(self, samples, chunk_size=1 << 22):
+        """Downconvert a complete record, e.g. a live transfer, in blocks of chunk_size samples."""
+        self.reset()
+        return np.concatenate([self.process(samples[start:start + chunk_size])
+                               for start in range(0, max(len(samples), 1), chunk_size)])
+
+    def metadata(self):
+        """Settings needed to interpret the I/Q output."""
+        return {'if_frequency': self.if_frequency, 'sample_rate': self.sample_rate,
+                'output_rate': self.output_rate, 'decimation': self.decimation, 'bandwidth': self.bandwidth,
+                'inverted': self.inverted, 'taps': self.taps_per_phase * self.decimation,
+                'group_delay': (self.taps_per_phase * self.decimation - 1) / 2 / self.sample_rate}
+
+
+def plan_downconverter(dwell_center_freq, sample_rate, bandwidth, **options):
+    """
+    Downconverter for a dwell, centred on the IF that the frequency plan puts the dwell at.
+
+    Args:
+        dwell_center_freq (float): Dwell center frequency in MHz
+        sample_rate (float): Scope sample rate in Hz
+        bandwidth (float): Bandwidth in Hz to keep around the dwell center
+        **options: Further DigitalDownconverter arguments
+
+    Returns:
+        tuple: (DigitalDownconverter, plan metadata dict)
+    """
+    if_mhz, inverted = intermediate_frequency(dwell_center_freq)
+    lo1, lo2, rfif = set_instrument_parameters(dwell_center_freq)
+    ddc = DigitalDownconverter(if_mhz * 1e6, sample_rate, bandwidth, inverted, **options)
+    plan = {'dwell_center_frequency': dwell_center_freq, 'lo1': lo1, 'lo2': lo2, 'rfif': rfif}
+    return ddc, {**plan, **ddc.metadata()}
+
+
+def save_metadata(path, metadata):
+    """Write the metadata of an I/Q file to a .json file of the same name."""
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+        json.dump(metadata, f, indent=2, default=str)
+
+
+def downconvert_wfm(path, output, dwell_center_freq, bandwidth, frame=0, chunk_size=1 << 22, **options):
+    """
+    Downconvert one frame of a .wfm file to I/Q, streaming it in chunks.
+
+    The output is a preallocated complex64 .npy file with a .json metadata file next to
+    it, or an HDF5 file with the metadata as attributes if output ends in '.h5'.
+
+    Args:
+        path (str): .wfm file recorded at the dwell
+        output (str): Output .npy or .h5 file
+        dwell_center_freq (float): Dwell center frequency in MHz
+        bandwidth (float): Bandwidth in Hz to keep around the dwell center
+        frame (int): Frame to downconvert
+        chunk_size (int): Input samples per block
+        **options: Further DigitalDownconverter arguments
+
+    Returns:
+        dict: Metadata stored with the I/Q samples
+    """
+    waveform, tstart, tscale = read_wfm(path, lazy=True, dtype='float32', frames=slice(frame, frame + 1))[:3]
+    ddc, metadata = plan_downconverter(dwell_center_freq, 1 / tscale, bandwidth, **options)
+    metadata.update({'source': path, 'frame': frame, 'tstart': tstart})
+    count = -(-len(waveform) // ddc.decimation)
+
+    if output.endswith('.h5'):
+        import h5py
+        f = h5py.File(output, 'w')
+        out = f.create_dataset('iq', shape=(count,), dtype=np.complex64, chunks=True)
+        out.attrs.update(metadata)
+    else:
+        f = None
+        out = np.lib.format.open_memmap(output, mode='w+', dtype=np.complex64, shape=(count,))
+        save_metadata(output, metadata)
+    try:
+        position = 0
+        for _, block in waveform.chunks(chunk_size):
+            iq = ddc.process(block[:, 0])
+            out[position:position + len(iq)] = iq
+            position += len(iq)
+    finally:
+        if f is not None:
+            f.close()
+        else:
+            out.flush()
+    return metadata
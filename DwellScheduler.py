@@ -0,0 +1,68 @@
+import math
+import time
+from collections import deque
+
+
+class DwellScheduler:
+    def __init__(self, spacing, start_time=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Plan repeats on a fixed grid of absolute start times and do queued work while idle.
+
+        Slot k starts at start_time + k * spacing, so slow queries in one repeat do not
+        shift the repeats after it. Work queued with add_idle_task() runs in the gap
+        before the next slot.
+
+        Args:
+            spacing (float): Seconds between repeat start times
+            start_time (float): Clock value of slot 0, defaults to the first wait_for_slot() call
+            clock (callable): Monotonic clock in seconds
+            sleep (callable): Sleep function, replaceable for dry runs
+        """
+        self.spacing = spacing
+        self.start_time = start_time
+        self.clock = clock
+        self.sleep = sleep
+        self.slot = -1
+        self.idle_tasks = deque()
+
+    def add_idle_task(self, func, *args, **kwargs):
+        """Queue func(*args, **kwargs) to run in the next idle window."""
+        self.idle_tasks.append((func, args, kwargs))
+
+    def run_idle_tasks(self):
+        """Run all queued idle tasks now, in the order they were added."""
+        while self.idle_tasks:
+            func, args, kwargs = self.idle_tasks.popleft()
+            func(*args, **kwargs)
+
+    def next_slot_time(self):
+        """Clock value at which the next slot starts."""
+        if self.start_time is None:
+            return self.clock()
+        return self.start_time + (self.slot + 1) * self.spacing
+
+    def wait_for_slot(self):
+        """
+        Run the idle tasks, then sleep until the next slot starts.
+
+        If the previous repeat overran, slots that already passed are skipped so the
+        grid stays aligned.
+
+        Returns:
+            tuple: (slot index, seconds late at the start of the slot)
+        """
+        self.run_idle_tasks()
+        now = self.clock()
+        if self.start_time is None:
+            self.start_time = now
+        self.slot += 1
+        slot_time = self.start_time + self.slot * self.spacing
+        if now > slot_time + self.spacing and self.spacing > 0:
+            self.slot = math.ceil((now - self.start_time) / self.spacing)  # skip missed slots
+            slot_time = self.start_time + self.slot * self.spacing
+        while True:
+            remaining = slot_time - self.clock()
+            if remaining <= 0:
+                break
+            self.sleep(remaining)
+        return self.slot, self.clock() - slot_time
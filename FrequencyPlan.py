@@ -0,0 +1,176 @@
+from bisect import bisect_left
+
+# Tuning table: (upper band edge in MHz, LO1 in MHz, LO2 in MHz, DIO RF/IF path).
+# Each row covers (previous upper edge, upper edge]; the first row starts at MIN_FREQUENCY inclusive.
+MIN_FREQUENCY = 500
+BANDS = [
+    (1000, 4600, 5000, "RF1IF1"),
+    (1500, 5100, 5000, "RF1IF1"),
+    (2000, 5600, 5000, "RF1IF1"),
+    (2500, 6100, 5000, "RF1IF1"),
+    (3000, 9500, 7900, "RF2IF3"),
+    (3500, 10000, 7900, "RF2IF3"),
+    (4000, 10500, 7900, "RF2IF3"),
+    (4500, 11000, 7900, "RF2IF3"),
+    (5000, 11500, 7900, "RF2IF3"),
+    (5500, 9000, 4900, "RF2IF3"),
+    (6000, 9500, 4900, "RF3IF1"),
+    (6500, 10000, 4900, "RF3IF1"),
+    (7000, 10500, 4900, "RF3IF1"),
+    (7500, 11000, 4900, "RF3IF1"),
+    (8000, 11500, 4900, "RF3IF1"),
+    (8500, 12500, 5400, "RF4IF2"),
+    (9000, 13000, 5400, "RF4IF2"),
+    (9500, 13500, 5400, "RF4IF2"),
+    (10000, 14000, 5400, "RF4IF2"),
+    (10500, 14500, 5400, "RF4IF2"),
+    (11000, 15000, 5400, "RF4IF2"),
+    (11500, 15500, 5400, "RF4IF2"),
+    (12000, 16000, 5400, "RF4IF2"),
+    (12500, 8500, 4900, "RF5IF1"),
+    (13000, 9000, 4900, "RF5IF1"),
+    (13500, 9500, 4900, "RF5IF1"),
+    (14000, 10000, 4900, "RF5IF1"),
+    (14500, 9800, 5600, "RF5IF2"),
+    (15000, 10300, 5600, "RF5IF2"),
+    (15500, 8500, 7900, "RF5IF3"),
+    (16000, 9000, 7900, "RF5IF3"),
+    (16500, 9500, 7900, "RF5IF3"),
+    (17000, 10000, 7900, "RF5IF3"),
+    (17500, 9800, 8600, "RF5IF4"),
+    (18000, 10300, 8600, "RF5IF4"),
+]
+BAND_EDGES = [band[0] for band in BANDS]
+
+# Settle time in seconds per retune: (fixed, per MHz of frequency travel) for the LOs, fixed for the DIO path
+DEFAULT_SETTLE_COSTS = {
+    'BNC845M_1': (0.05, 1e-5),
+    'BNC845M_2': (0.05, 1e-5),
+    'DIOController': 0.02,
+}
+
+
+def set_instrument_parameters(dwell_center_freq):
+    """
+    Look up the LO frequencies and RF/IF path for a dwell center frequency.
+
+    Args:
+        dwell_center_freq (float): Dwell center frequency in MHz (500 to 18000)
+
+    Returns:
+        tuple: (lo1, lo2, rfif)
+    """
+    if not MIN_FREQUENCY <= dwell_center_freq <= BAND_EDGES[-1]:
+        raise ValueError("Invalid center frequency value")
+    _, lo1, lo2, rfif = BANDS[bisect_left(BAND_EDGES, dwell_center_freq)]
+    return lo1, lo2, rfif
+
+
+def intermediate_frequency(dwell_center_freq):
+    """
+    Frequency at which a dwell center frequency reaches the scopes after both mixers.
+
+    Args:
+        dwell_center_freq (float): Dwell center frequency in MHz
+
+    Returns:
+        tuple: (IF in MHz, True if the spectrum is mirrored relative to RF)
+    """
+    lo1, lo2, _ = set_instrument_parameters(dwell_center_freq)
+    if1 = abs(lo1 - dwell_center_freq)
+    inverted = lo1 > dwell_center_freq  # a high-side LO mirrors the spectrum
+    if2 = abs(lo2 - if1)
+    inverted ^= lo2 > if1
+    return if2, inverted
+
+
+def build_plan(config):
+    """
+    Build the tuning plan for every Dwell_* section of a config, in config order.
+
+    Args:
+        config (configparser.ConfigParser): Parsed config.ini
+
+    Returns:
+        list: One dict per dwell with keys 'dwell', 'frequency', 'lo1', 'lo2' and 'rfif'
+    """
+    plan = []
+    for dwell_name in (s for s in config.sections() if s.startswith('Dwell_')):
+        frequency = config.getint(dwell_name, 'dwell_center_frequency')
+        try:
+            lo1, lo2, rfif = set_instrument_parameters(frequency)
+        except ValueError as e:
+            raise ValueError(f"{dwell_name}: {e} ({frequency} MHz)") from e
+        plan.append({'dwell': dwell_name, 'frequency': frequency, 'lo1': lo1, 'lo2': lo2, 'rfif': rfif})
+    return plan
+
+
+def transition_cost(a, b, costs=DEFAULT_SETTLE_COSTS):
+    """Settle time in seconds to retune from plan entry a to plan entry b (a may be None)."""
+    cost = 0.0
+    for key, instrument in (('lo1', 'BNC845M_1'), ('lo2', 'BNC845M_2')):
+        if a is None or a[key] != b[key]:
+            fixed, per_mhz = costs[instrument]
+            cost += fixed + (0 if a is None else per_mhz * abs(a[key] - b[key]))
+    if a is None or a['rfif'] != b['rfif']:
+        cost += costs['DIOController']
+    return cost
+
+
+def plan_cost(plan, costs=DEFAULT_SETTLE_COSTS, start=None):
+    """Total settle time of running the plan in order, starting from tuning state start."""
+    total, previous = 0.0, start
+    for entry in plan:
+        total += transition_cost(previous, entry, costs)
+        previous = entry
+    return total
+
+
+def optimize_order(plan, costs=DEFAULT_SETTLE_COSTS, start=None, max_passes=20):
+    """
+    Reorder the dwells to reduce total LO travel and RF/IF path changes.
+
+    Starts from the better of frequency order and a nearest-neighbour tour, then
+    improves it with 2-opt segment reversals.
+
+    Args:
+        plan (list): Entries from build_plan()
+        costs (dict): Settle-time costs, see DEFAULT_SETTLE_COSTS
+        start (dict): Current tuning state, or None if unknown
+        max_passes (int): Upper bound on 2-opt improvement passes
+
+    Returns:
+        list: The same entries in the new order
+    """
+    if len(plan) < 3:
+        return min((list(plan), list(plan[::-1])), key=lambda order: plan_cost(order, costs, start))
+
+    candidates = [sorted(plan, key=lambda entry: entry['frequency'])]
+    remaining, previous, tour = list(plan), start, []
+    while remaining:
+        entry = min(remaining, key=lambda e: transition_cost(previous, e, costs))
+        remaining.remove(entry)
+        tour.append(entry)
+        previous = entry
+    candidates.append(tour)
+    best = min(candidates, key=lambda order: plan_cost(order, costs, start))
+
+    def cost(a, b):
+        return 0.0 if b is None else transition_cost(a, b, costs)
+
+    # Reversing best[i:j] only changes the transitions into and out of the segment
+    n = len(best)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n - 1):
+            before = best[i - 1] if i > 0 else start
+            for j in range(i + 2, n + 1):
+                after = best[j] if j < n else None
+                delta = (cost(before, best[j - 1]) + cost(best[i], after)
+                         - cost(before, best[i]) - cost(best[j - 1], after))
+                if delta < -1e-12:
+                    best[i:j] = best[i:j][::-1]
+                    improved = True
+        if not improved:
+            break
+    return best
@@ -0,0 +1,45 @@
+import subprocess
+import sys
+
+# Modules whose import cost the entry points should only pay when they are actually needed
+HEAVY_MODULES = ['pyvisa', 'nidaqmx', 'numpy', 'scipy', 'scipy.io', 'matplotlib', 'matplotlib.pyplot', 'h5py']
+
+# Entry points and driver modules to measure
+MODULES = ['main', 'FrequencyPlan', 'DwellScheduler', 'SessionPool', 'CommandBatcher', 'PooledDriver', 'TektronixMSO68B',
+           'BNC845M', 'NGP800PowerSupply', 'SMW200A', 'DIOController', 'wfmReader', 'WfmConverter', 'WfmCatalog',
+           'Concatenate_mat']
+
+
+def time_import(module, repeats=5):
+    """
+    Measure the import time of a module in fresh interpreters.
+
+    Args:
+        module (str): Module name, imported from the current directory
+        repeats (int): Number of interpreters started, the fastest run is reported
+
+    Returns:
+        tuple: (seconds, list of heavy modules loaded), or (None, error message) if the import failed
+    """
+    code = (f"import sys, time; start = time.perf_counter(); import {module}; "
+            f"elapsed = time.perf_counter() - start; "
+            f"print(elapsed); print('heavy:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    best, loaded = None, []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        lines = result.stdout.splitlines()
+        elapsed, loaded = float(lines[-2]), [m for m in lines[-1][len('heavy:'):].split(',') if m]
+        best = elapsed if best is None else min(best, elapsed)
+    return best, loaded
+
+
+if __name__ == "__main__":
+    print(f"{'module':<20} {'import time':>12}  heavy modules loaded")
+    for module in sys.argv[1:] or MODULES:
+        seconds, loaded = time_import(module)
+        if seconds is None:
+            print(f"{module:<20} {'failed':>12}  {loaded}")
+        else:
+            print(f"{module:<20} {seconds * 1000:9.1f} ms  {', '.join(loaded) or '-'}")
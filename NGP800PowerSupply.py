@@ -1,7 +1,7 @@
-import pyvisa
+from PooledDriver import PooledDriver
 
 
-class NGP800PowerSupply:
+class NGP800PowerSupply(PooledDriver):
     def __init__(self, resource_name):
         """
         Initialize the Rohde & Schwarz NGP800 power supply.
@@ -9,9 +9,8 @@ class NGP800PowerSupply:
         Args:
             resource_name (str): VISA resource name (e.g., 'TCPIP0::192.168.1.100::inst0::INSTR')
         """
-        self.rm = pyvisa.ResourceManager()
-        self.instrument = self.rm.open_resource(resource_name)
-        self.instrument.timeout = 5000  # Set a reasonable timeout (in milliseconds)
+        self.resource_name = resource_name
+        self.connect(resource_name, timeout=5000)  # Set a reasonable timeout (in milliseconds)
 
     def identify(self):
         """Query and print the instrument identification."""
@@ -27,23 +26,27 @@ class NGP800PowerSupply:
             voltage (float): Voltage in volts
             current (float): Current in amps
         """
-        self.instrument.write(f"INST:SEL CH{channel}")
-        self.instrument.write(f"VOLT {voltage:.6f}")
-        self.instrument.write(f"CURR {current:.6f}")
+        if self.state.is_current(f'ch{channel}', (voltage, current)):
+            return
+        with self.batch():
+            self.instrument.write(f"INST:SEL CH{channel}")
+            self.instrument.write(f"VOLT {voltage:.6f}")
+            self.instrument.write(f"CURR {current:.6f}")
+        self.state.update(f'ch{channel}', (voltage, current))
 
     def start_output(self):
         """Start the output of all channels."""
-        self.instrument.write(":OUTP ON")
+        if not self.state.is_current('output', 'ON'):
+            self.instrument.write(":OUTP ON")
+            self.state.update('output', 'ON')
         print("Output started for all channels")
 
     def stop_output(self):
         """Stop the output of all channels."""
-        self.instrument.write(":OUTP OFF")
+        self.instrument.write(":OUTP OFF")  # always sent, switching off must not depend on the cache
+        self.state.update('output', 'OFF')
         print("Output stopped for all channels")
 
-    def close(self):
-        """Close the instrument connection."""
-        self.instrument.close()
 
 
 # Example usage:
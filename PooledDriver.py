@@ -0,0 +1,42 @@
+from CommandBatcher import CommandBatcher
+from SessionPool import sessions
+from StateCache import StateCache
+
+
+class PooledDriver:
+    def connect(self, address, **settings):
+        """
+        Set up the SCPI session shared by the instrument drivers.
+
+        The VISA session comes from the process-wide pool and stays open for reuse
+        after close(). It is wrapped in a CommandBatcher so writes can be coalesced
+        with batch(), and paired with a StateCache of the last written settings, which
+        lets repeated dwells skip redundant writes.
+
+        Args:
+            address (str): VISA resource name (e.g., 'TCPIP0::192.168.141.71::inst0::INSTR')
+            **settings: Session attributes (timeout, read_termination, ...)
+        """
+        self.address = address
+        self.state = StateCache()
+        self.instrument = CommandBatcher(sessions.acquire(address, **settings), state=self.state)
+
+    def batch(self, sync=False):
+        """
+        Coalesce the writes issued inside the with-block into one program message.
+
+        Args:
+            sync (bool): Wait for a single *OPC? after the message
+        """
+        return self.instrument.batch(sync)
+
+    def close(self):
+        """The VISA session stays in the process-wide session pool for reuse."""
+
+    def reconnect(self):
+        """Replace the VISA session with a freshly opened one; cached settings are dropped."""
+        self.instrument.reconnect(sessions.reopen(self.address))
+
+    def invalidate_state(self):
+        """Forget all cached settings, e.g. after changing them from the front panel or with write()."""
+        self.state.invalidate()
@@ -1,34 +1,38 @@
-import pyvisa
 import time
+from PooledDriver import PooledDriver
 
 
-class SMW200A:
+class SMW200A(PooledDriver):
     def __init__(self, address):
-        self.rm = pyvisa.ResourceManager()
-        self.instr = self.rm.open_resource(address)
+        self.connect(address)
 
     def identify(self):
-        idn = self.instr.query("*IDN?")
+        idn = self.instrument.query("*IDN?")
         print(f"Instrument identification: {idn.strip()}")
 
     def set_frequency(self, freq):
-        self.instr.write(f"SOURce:FREQuency:FIXed {freq}Hz")
+        if not self.state.is_current('frequency', freq):
+            self.instrument.write(f"SOURce:FREQuency:FIXed {freq}Hz")
+            self.state.update('frequency', freq)
         print(f"Set frequency to {freq} Hz")
 
     def set_power_level(self, level):
-        self.instr.write(f"SOURce:POWer:LEVel:IMMediate:AMPLitude {level}dBm")
+        if not self.state.is_current('power_level', level):
+            self.instrument.write(f"SOURce:POWer:LEVel:IMMediate:AMPLitude {level}dBm")
+            self.state.update('power_level', level)
         print(f"Set power level to {level} dBm")
 
     def start_signal(self):
-        self.instr.write("OUTPut:STATe ON")
+        if not self.state.is_current('output', 'ON'):
+            self.instrument.write("OUTPut:STATe ON")
+            self.state.update('output', 'ON')
         print("Signal output started")
 
     def stop_signal(self):
-        self.instr.write("OUTPut:STATe OFF")
+        self.instrument.write("OUTPut:STATe OFF")  # always sent, switching off must not depend on the cache
+        self.state.update('output', 'OFF')
         print("Signal output stopped")
 
-    def close(self):
-        self.instr.close()
 
 
 if __name__ == "__main__":
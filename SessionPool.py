@@ -0,0 +1,127 @@
+import atexit
+import threading
+import time
+
+
+class SessionPool:
+    def __init__(self, backend='', open_retries=3, retry_delay=0.5):
+        """
+        Process-wide pool of VISA sessions, keyed by resource address.
+
+        All drivers share one ResourceManager. A driver gets its session with
+        acquire(); closing the driver leaves the session open so the next driver for
+        the same address (e.g. in the next run of a long-lived process) reuses it
+        instead of paying for a new connection. Sessions are closed when the process
+        exits, or earlier with close_all().
+
+        Args:
+            backend (str): pyvisa backend, '' for the default VISA library
+            open_retries (int): Extra attempts when opening a resource fails
+            retry_delay (float): Seconds before the first retry, doubled on each attempt
+        """
+        self.backend = backend
+        self.open_retries = open_retries
+        self.retry_delay = retry_delay
+        self.rm = None
+        self.sessions = {}  # address -> [resource, settings]
+        self.lock = threading.Lock()
+
+    def resource_manager(self):
+        """Return the shared ResourceManager, creating it on first use."""
+        with self.lock:
+            if self.rm is None:
+                import pyvisa  # loaded on first use so importing a driver module stays cheap
+                self.rm = pyvisa.ResourceManager(self.backend)
+            return self.rm
+
+    @staticmethod
+    def is_healthy(resource, probe=False):
+        """
+        Check that a session is still usable.
+
+        Args:
+            resource: pyvisa resource
+            probe (bool): Also do an *OPC? round trip, otherwise only the session handle is checked
+        """
+        try:
+            resource.session  # raises once the session has been closed
+            if probe:
+                resource.query('*OPC?')
+            return True
+        except Exception:
+            return False
+
+    def open(self, address, settings):
+        rm = self.resource_manager()
+        from pyvisa.errors import VisaIOError
+        delay = self.retry_delay
+        for attempt in range(self.open_retries + 1):
+            try:
+                return rm.open_resource(address, **settings)
+            except VisaIOError:
+                if attempt == self.open_retries:
+                    raise
+                time.sleep(delay)  # opens occasionally fail when many sessions start at once
+                delay *= 2
+
+    def acquire(self, address, probe=False, **settings):
+        """
+        Get the pooled session for an address, opening it if needed.
+
+        Args:
+            address (str): VISA resource name (e.g., 'TCPIP0::192.168.141.134::inst0::INSTR')
+            probe (bool): Verify a reused session with an *OPC? round trip
+            **settings: Session attributes applied on open and reuse (timeout, read_termination, ...)
+
+        Returns:
+            pyvisa resource
+        """
+        with self.lock:
+            entry = self.sessions.get(address)
+        if entry is not None and self.is_healthy(entry[0], probe):
+            for name, value in settings.items():
+                setattr(entry[0], name, value)
+            with self.lock:
+                entry[1] = settings
+            return entry[0]
+        if entry is not None:
+            self.discard(address)
+        resource = self.open(address, settings)
+        with self.lock:
+            self.sessions[address] = [resource, settings]
+        return resource
+
+    def reopen(self, address):
+        """Close the session for an address and open a fresh one with the same settings."""
+        with self.lock:
+            entry = self.sessions.get(address)
+        settings = entry[1] if entry is not None else {}
+        self.discard(address)
+        resource = self.open(address, settings)
+        with self.lock:
+            self.sessions[address] = [resource, settings]
+        return resource
+
+    def discard(self, address):
+        """Close and forget the session for an address."""
+        with self.lock:
+            entry = self.sessions.pop(address, None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        """Close every pooled session and the ResourceManager."""
+        for address in list(self.sessions):
+            self.discard(address)
+        with self.lock:
+            if self.rm is not None:
+                self.rm.close()
+                self.rm = None
+
+
+# Shared by all drivers in this process
+sessions = SessionPool()
+atexit.register(sessions.close_all)
@@ -0,0 +1,161 @@
+"""
+Stand-in for the parts of nidaqmx used by DIOController, to run without the hardware.
+
+Pass the module as the backend: DIOController('USB-6509', backend=SimulatedDAQ).
+Line states are kept per channel name in `outputs`, every sample that reaches the
+lines is appended to `history` as (time, channel, value), and edges on external
+clock or trigger terminals are simulated with pulse().
+"""
+import enum
+import math
+import threading
+import time
+from types import SimpleNamespace
+
+
+class LineGrouping(enum.Enum):
+    CHAN_PER_LINE = 0
+    CHAN_FOR_ALL_LINES = 1
+
+
+class Edge(enum.Enum):
+    RISING = 10280
+    FALLING = 10171
+
+
+class AcquisitionType(enum.Enum):
+    FINITE = 10178
+    CONTINUOUS = 10123
+
+
+constants = SimpleNamespace(LineGrouping=LineGrouping, Edge=Edge, AcquisitionType=AcquisitionType)
+
+outputs = {}  # channel name -> last value driven on it
+history = []  # (time, channel name, value) for every sample that reached the lines
+clock = time.monotonic
+lock = threading.RLock()
+armed = []  # started buffered tasks that have not finished yet
+
+
+def pulse(terminal, count=1):
+    """Simulate count edges on a terminal, e.g. '/Dev1/PFI0', for tasks clocked or triggered by it."""
+    with lock:
+        for task in list(armed):
+            for _ in range(count):
+                task.edge(terminal)
+
+
+def reset():
+    """Forget all line states and history."""
+    with lock:
+        outputs.clear()
+        history.clear()
+        armed.clear()
+
+
+class Task:
+    def __init__(self, new_task_name=''):
+        self.name = new_task_name
+        self.channels = []
+        self.line_grouping = None
+        self.rate = None
+        self.clock_source = ''
+        self.trigger_source = None
+        self.samples = None  # buffered data, one list per channel
+        self.position = 0  # samples already driven on the lines
+        self.start_time = None  # set when the sequence starts running
+        self.do_channels = SimpleNamespace(add_do_chan=self.add_do_chan)
+        self.timing = SimpleNamespace(cfg_samp_clk_timing=self.cfg_samp_clk_timing)
+        self.triggers = SimpleNamespace(
+            start_trigger=SimpleNamespace(cfg_dig_edge_start_trig=self.cfg_dig_edge_start_trig))
+
+    def add_do_chan(self, lines, name_to_assign_to_lines='', line_grouping=LineGrouping.CHAN_FOR_ALL_LINES):
+        self.channels.append(lines)
+        self.line_grouping = line_grouping
+
+    def cfg_samp_clk_timing(self, rate, source='', active_edge=Edge.RISING,
+                            sample_mode=AcquisitionType.FINITE, samps_per_chan=1000):
+        if sample_mode != AcquisitionType.FINITE:
+            raise ValueError("Only finite sequences are simulated")
+        self.rate = rate
+        self.clock_source = source
+
+    def cfg_dig_edge_start_trig(self, trigger_source, trigger_edge=Edge.RISING):
+        self.trigger_source = trigger_source
+
+    def drive(self, timestamp, values):
+        with lock:
+            for channel, value in zip(self.channels, values):
+                outputs[channel] = value
+                history.append((timestamp, channel, value))
+
+    def write(self, data, auto_start=True, timeout=10.0):
+        data = [list(column) if hasattr(column, '__len__') else column for column in data]
+        if len(data) != len(self.channels):
+            raise ValueError(f"Got data for {len(data)} channels, task has {len(self.channels)}")
+        if self.rate is None:
+            self.drive(clock(), data)  # on-demand write
+        else:
+            self.samples = data
+            self.position = 0
+            if auto_start:
+                self.start()
+        return len(data)
+
+    def start(self):
+        if self.samples is None:
+            return
+        with lock:
+            self.position = 0
+            self.start_time = None if self.trigger_source else clock()
+            armed.append(self)
+        self.update()
+
+    def edge(self, terminal):
+        if terminal == self.trigger_source and self.start_time is None:
+            self.start_time = clock()
+            self.update()
+        elif terminal == self.clock_source and self.start_time is not None:
+            self.advance(self.position + 1, clock())
+
+    def advance(self, position, timestamp):
+        total = len(self.samples[0])
+        while self.position < min(position, total):
+            self.drive(timestamp, [column[self.position] for column in self.samples])
+            self.position += 1
+        if self.position == total and self in armed:
+            armed.remove(self)
+
+    def update(self):
+        # Internal sample clock: sample k is driven at start_time + k / rate
+        with lock:
+            if self.start_time is None or self.clock_source or self not in armed:
+                return
+            due = math.floor((clock() - self.start_time) * self.rate) + 1
+            while self.position < min(due, len(self.samples[0])):
+                self.advance(self.position + 1, self.start_time + self.position / self.rate)
+
+    def is_task_done(self):
+        self.update()
+        return self not in armed
+
+    def wait_until_done(self, timeout=10.0):
+        deadline = clock() + timeout
+        while not self.is_task_done():
+            if clock() > deadline:
+                raise TimeoutError(f"Sequence not done after {timeout} s ({self.position} samples written)")
+            time.sleep(min(1.0 / self.rate, 0.01) if self.rate else 0.01)
+
+    def read(self, number_of_samples_per_channel=1):
+        values = [outputs.get(channel, 0) for channel in self.channels]
+        if len(values) == 1:
+            return values
+        return [[value] for value in values]
+
+    def stop(self):
+        with lock:
+            if self in armed:
+                armed.remove(self)
+
+    def close(self):
+        self.stop()
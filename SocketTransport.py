@@ -0,0 +1,126 @@
+import socket
+import numpy as np
+
+
+class SocketTransport:
+    def __init__(self, host, port=4000, timeout=20):
+        """
+        Open a raw-socket connection to an instrument (Tektronix scopes listen on port 4000).
+
+        Args:
+            host (str): Instrument IP address (e.g., '192.168.141.134')
+            port (int): Raw-socket port
+            timeout (float): Socket timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.encoding = 'latin_1'  # native encoding for scope
+        self.socket = None
+        self.connect()
+
+    def connect(self):
+        """Open the TCP connection to the instrument."""
+        self.socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # small SCPI writes go out immediately
+
+    def reconnect(self):
+        """Drop the connection and open a fresh one, discarding any partially read response."""
+        self.close()
+        self.connect()
+        self.clear()
+
+    def write(self, scpi):
+        """Send a SCPI command terminated with a linefeed."""
+        self.socket.sendall(f'{scpi}\n'.encode(self.encoding))
+
+    def read(self):
+        """Read an ASCII response up to the terminating linefeed."""
+        resp = bytearray()
+        while resp[-1:] != b'\n':
+            chunk = self.socket.recv(1024)
+            if not chunk:
+                raise ConnectionError(f"Connection to {self.host}:{self.port} closed during read")
+            resp += chunk
+        return resp.decode(self.encoding).strip()
+
+    def query(self, scpi):
+        """Send a SCPI query and return the response string."""
+        self.write(scpi)
+        return self.read()
+
+    def read_into(self, buffer):
+        """
+        Fill a writable buffer completely from the socket without intermediate copies.
+
+        Args:
+            buffer: Any writable buffer (bytearray, memoryview, NumPy array)
+
+        Returns:
+            int: Number of bytes received
+        """
+        mv = memoryview(buffer).cast('B')
+        total = len(mv)
+        while mv:
+            n = self.socket.recv_into(mv)
+            if n == 0:
+                raise ConnectionError(f"Connection to {self.host}:{self.port} closed during read")
+            mv = mv[n:]
+        return total
+
+    def read_bytes(self, n_bytes):
+        """Read exactly n_bytes of raw data."""
+        raw_data = bytearray(n_bytes)
+        self.read_into(raw_data)
+        return raw_data
+
+    def read_block_header(self):
+        """
+        Parse an IEEE 488.2 definite-length block header (e.g. '#72500000').
+
+        Returns:
+            int: Number of data bytes that follow the header
+        """
+        head = self.read_bytes(2)
+        if head[:1] != b'#':
+            raise ValueError(f"Expected binary block header, got {bytes(head)!r}")
+        num_digits = int(head[1:2].decode(self.encoding), base=16)
+        if num_digits == 0:
+            raise ValueError("Indefinite-length binary blocks are not supported")
+        return int(self.read_bytes(num_digits).decode(self.encoding))
+
+    def read_block_into(self, out=None, dtype='int16', num_bytes=None):
+        """
+        Read a binary block straight into a preallocated NumPy array.
+
+        Args:
+            out (np.ndarray): Destination array, allocated from the header length if None
+            dtype (str): Sample data type used when out is None
+            num_bytes (int): Block length if the header was already read with read_block_header()
+
+        Returns:
+            np.ndarray: View of out holding exactly the samples received
+        """
+        if num_bytes is None:
+            num_bytes = self.read_block_header()
+        if out is None:
+            out = np.empty(num_bytes // np.dtype(dtype).itemsize, dtype=dtype)
+        if num_bytes > out.nbytes:
+            raise ValueError(f"Block of {num_bytes} bytes does not fit in buffer of {out.nbytes} bytes")
+        samples = num_bytes // out.itemsize
+        self.read_into(out[:samples])
+        if self.read_bytes(1) != b'\n':  # block is terminated by a linefeed
+            raise ValueError("Binary block did not end with linefeed")
+        return out[:samples]
+
+    def clear(self):
+        """Device clear, behaves like pyvisa instrument.clear()."""
+        self.write('!d')
+
+    def close(self):
+        """Close the socket connection."""
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)  # informs instrument prior to closure
+        except OSError:
+            pass
+        self.socket.close()
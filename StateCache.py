@@ -0,0 +1,34 @@
+class StateCache:
+    def __init__(self):
+        """
+        Shadow copy of the settings a driver has written, keyed by setting name.
+
+        Each entry keeps the value that was requested and the value the instrument
+        confirmed (its read-back, or the requested value when there is none). Drivers
+        skip a write when the requested value is already current and answer read-backs
+        from the confirmed value.
+        """
+        self.requested = {}
+        self.confirmed = {}
+
+    def is_current(self, key, value):
+        """Return True if value was the last successfully written value for key."""
+        return key in self.requested and self.requested[key] == value
+
+    def get(self, key, default=None):
+        """Return the last confirmed value for key."""
+        return self.confirmed.get(key, default)
+
+    def update(self, key, value, confirmed=None):
+        """Record a successful write of value, with the instrument's read-back if any."""
+        self.requested[key] = value
+        self.confirmed[key] = value if confirmed is None else confirmed
+
+    def invalidate(self, *keys):
+        """Forget the given settings, or every setting when called without keys."""
+        if not keys:
+            self.requested.clear()
+            self.confirmed.clear()
+        for key in keys:
+            self.requested.pop(key, None)
+            self.confirmed.pop(key, None)
@@ -1,28 +1,265 @@
-from datetime import time
-import pyvisa
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from CommandBatcher import CommandBatcher
+from PooledDriver import PooledDriver
+from SocketTransport import SocketTransport
 
 
-class TektronixMSO68B:
+class TektronixMSO68B(PooledDriver):
     def __init__(self, visa_address):
         self.visa_address = visa_address
-        self.rm = pyvisa.ResourceManager()
-        self.instrument = self.rm.open_resource(visa_address, timeout=15000)  # Adjust timeout as needed
-        self.instrument.write_termination = None
-        self.instrument.read_termination = '\n'
-        self.instrument.encoding = 'latin_1'
+        self.connect(visa_address, timeout=15000,  # Adjust timeout as needed
+                     write_termination=None, read_termination='\n', encoding='latin_1')
+        self.socket = None  # raw-socket transport for bulk curve transfers, see open_socket()
+        self.curve_dtype = 'int16'
+
+    def open_socket(self, port=4000, timeout=20):
+        """
+        Open the raw-socket transport used for CURVe? transfers.
+
+        Args:
+            port (int): Socket server port configured on the scope
+            timeout (float): Socket timeout in seconds
+        """
+        host = self.visa_address.split('::')[1]
+        self.socket = SocketTransport(host, port, timeout=timeout)
+        self.socket.clear()
+        self.socket.query('*OPC?')  # sync before first transfer
+        return self.socket
+
+    def configure_curve(self, byte_width=2, start=1, stop=None):
+        """
+        Configure waveform transfer as signed binary for fetch_curve().
+
+        Args:
+            byte_width (int): Bytes per sample, 1 or 2 for analog channels
+            start (int): First record point to transfer
+            stop (int): Last record point to transfer, defaults to the full record length
+
+        Returns:
+            int: Number of points per curve
+        """
+        if byte_width not in (1, 2):
+            raise ValueError("Invalid byte width. Must be 1 or 2.")
+        if self.socket is None:
+            self.open_socket()
+        if stop is None:
+            stop = int(self.socket.query('HORizontal:RECOrdlength?'))
+        self.socket.write('DATa:ENCdg SRIBINARY')
+        self.socket.write(f'DATa:STARt {start}')
+        self.socket.write(f'DATa:STOP {stop}')
+        self.socket.write(f'WFMOutpre:BYT_Nr {byte_width}')
+        self.socket.query('*OPC?')
+        self.curve_dtype = 'int8' if byte_width == 1 else 'int16'
+        return stop - start + 1
+
+    def fetch_curve(self, channel, out=None):
+        """
+        Fetch one channel's CURVe? block over the raw socket directly into a NumPy buffer.
+
+        Args:
+            channel (int): Channel number (1 to 8)
+            out (np.ndarray): Preallocated destination, reuse it across channels to avoid reallocations
+
+        Returns:
+            np.ndarray: Raw signed samples, a view of out if it was given
+        """
+        if channel not in range(1, 9):
+            raise ValueError(f"Invalid channel number: {channel}. Must be 1 to 8.")
+        if self.socket is None:
+            self.open_socket()
+        self.socket.write(f'DATa:SOUrce CH{channel}')
+        self.socket.write('CURVe?')
+        return self.socket.read_block_into(out, dtype=self.curve_dtype)
+
+    def curve_scale(self):
+        """
+        Query the vertical scaling of the current data source.
+
+        Returns:
+            tuple: (ymult, yzero, yoff) so that volts = (raw - yoff) * ymult + yzero
+        """
+        response = self.socket.query('WFMOutpre:YMUlt?;YZEro?;YOFf?')
+        ymult, yzero, yoff = (float(value) for value in response.split(';'))
+        return ymult, yzero, yoff
+
+    def fetch_channels(self, channels, output_dir, prefix='Tek', byte_width=2, dtype='float32', transform=None):
+        """
+        Download, scale and save several channels as a pipeline.
+
+        While channel N is on the wire, channel N-1 is scaled on one worker and
+        channel N-2 is written to disk on another, so the link stays busy for the
+        whole sweep. Raw samples land in one of two reused buffers.
+
+        Args:
+            channels (list): Channel numbers to acquire (1 to 8)
+            output_dir (str): Directory for the per-channel .npy files
+            prefix (str): File name prefix, files are named '{prefix}_ch{n}.npy'
+            byte_width (int): Bytes per sample on the wire, 1 or 2
+            dtype (str): Output sample type for scaled volts, or None to save raw samples
+            transform (callable): Applied to each converted record before saving, e.g. a
+                DigitalDownconverter's downconvert to keep only baseband I/Q
+
+        Returns:
+            list: Paths of the written files, in channel order
+        """
+        num_points = self.configure_curve(byte_width)
+        buffers = [np.empty(num_points, dtype=self.curve_dtype) for _ in range(2)]
+        os.makedirs(output_dir, exist_ok=True)
+
+        def convert(raw, scale):
+            if dtype is None:
+                scaled = raw.copy()
+            else:
+                ymult, yzero, yoff = scale
+                scaled = raw.astype(dtype)
+                scaled -= yoff
+                scaled *= ymult
+                scaled += yzero
+            return scaled if transform is None else transform(scaled)
+
+        def save(converted, path):
+            np.save(path, converted.result())
+            return path
+
+        converted, written = [], []
+        with ThreadPoolExecutor(max_workers=1) as converter, ThreadPoolExecutor(max_workers=1) as writer:
+            for i, channel in enumerate(channels):
+                if i >= 2:
+                    converted[i - 2].result()  # buffer i % 2 is free again once channel i-2 is converted
+                if i >= 3:
+                    written[i - 3].result()  # bound the number of scaled records held in memory
+                raw = self.fetch_curve(channel, out=buffers[i % 2])
+                future = converter.submit(convert, raw, self.curve_scale())
+                converted.append(future)
+                path = os.path.join(output_dir, f"{prefix}_ch{channel}.npy")
+                written.append(writer.submit(save, future, path))
+            return [future.result() for future in written]
+
+    def fetch_curve_windowed(self, channel, path, window_points=10000000, workers=1, retries=3, byte_width=2):
+        """
+        Fetch a long record as DATa:STARt/STOP windows into a memory-mapped .npy file.
+
+        A failed window is retried on a fresh connection without discarding the
+        windows already on disk. Completed windows are listed in '{path}.progress',
+        so calling again after an abort resumes where the transfer stopped. The
+        progress file also records ACQuire:NUMACq?, the window size and the byte
+        width; if the scope has acquired since or the windows differ, the windows on
+        disk cannot be trusted and the transfer starts over.
+
+        DATa:SOUrce/STARt/STOP are scope-wide settings, so with several sessions each
+        one holds a lock from setting up its window until the block header arrives;
+        only the sample data of different windows is transferred in parallel.
+
+        Args:
+            channel (int): Channel number (1 to 8)
+            path (str): Output .npy file holding the raw signed samples
+            window_points (int): Record points per CURVe? request
+            workers (int): Number of socket sessions fetching windows in parallel
+            retries (int): Attempts per window after the first failure
+            byte_width (int): Bytes per sample on the wire, 1 or 2
+
+        Returns:
+            np.memmap: The assembled record
+        """
+        if channel not in range(1, 9):
+            raise ValueError(f"Invalid channel number: {channel}. Must be 1 to 8.")
+        num_points = self.configure_curve(byte_width)
+        progress_path = f"{path}.progress"
+        header = (f"NUMACq {int(self.socket.query('ACQuire:NUMACq?'))} CH{channel} "
+                  f"window {window_points} width {byte_width}")
+
+        out, done = None, set()
+        if os.path.exists(path) and os.path.exists(progress_path):
+            out = np.lib.format.open_memmap(path, mode='r+')
+            with open(progress_path) as f:
+                lines = [line.strip() for line in f if line.strip()]
+            if (out.shape == (num_points,) and out.dtype == np.dtype(self.curve_dtype)
+                    and lines[:1] == [header]):
+                done = {int(line) for line in lines[1:]}
+            else:
+                del out
+                out = None
+        if out is None:
+            out = np.lib.format.open_memmap(path, mode='w+', dtype=self.curve_dtype, shape=(num_points,))
+            with open(progress_path, 'w') as f:
+                f.write(f"{header}\n")
+
+        windows = [(start, min(start + window_points, num_points))
+                   for start in range(0, num_points, window_points) if start not in done]
+        lock = threading.Lock()
+        window_lock = threading.Lock()
+        transports = queue.Queue()
+        transports.put(self.socket)
+        for _ in range(max(workers, 1) - 1):
+            transports.put(SocketTransport(self.socket.host, self.socket.port, timeout=self.socket.timeout))
+
+        def fetch_window(window):
+            start, stop = window
+            transport = transports.get()
+            try:
+                for attempt in range(retries + 1):
+                    try:
+                        # the window settings hold until the scope has started answering this CURVe?
+                        with window_lock:
+                            transport.write(f'DATa:SOUrce CH{channel};:DATa:STARt {start + 1};'
+                                            f':DATa:STOP {stop};:CURVe?')
+                            num_bytes = transport.read_block_header()
+                        received = transport.read_block_into(out[start:stop], num_bytes=num_bytes)
+                        if len(received) != stop - start:
+                            raise ValueError(f"Window {start + 1}-{stop} returned {len(received)} points")
+                        break
+                    except (OSError, ValueError) as e:
+                        transport.reconnect()  # stream position is unknown after a failed read
+                        if attempt == retries:
+                            raise
+                        print(f"Window {start + 1}-{stop} failed ({e}), retrying")
+                with lock:
+                    with open(progress_path, 'a') as f:
+                        f.write(f"{start}\n")
+            finally:
+                transports.put(transport)
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+                list(pool.map(fetch_window, windows))
+        finally:
+            while not transports.empty():
+                transport = transports.get()
+                if transport is not self.socket:
+                    transport.close()
+            out.flush()
+            try:
+                self.socket.write(f'DATa:STARt 1;:DATa:STOP {num_points}')  # restore full-record transfers
+            except OSError:
+                pass  # a failed transfer re-raises its own error below
+        os.remove(progress_path)
+        return out
 
     def set_sample_rate(self, sample_rate):
-        self.instrument.write(f':HORizontal:MODE:SAMPLERate {sample_rate}')
-        self.instrument.query("*OPC?") #make sure operations are complete before continuing
+        if self.state.is_current('sample_rate', sample_rate):
+            return self.state.get('sample_rate')  # already set, answer the read-back locally
+        with self.batch():
+            self.instrument.write(f':HORizontal:MODE:SAMPLERate {sample_rate}')
+            self.instrument.query("*OPC?") #make sure operations are complete before continuing
         # Read back the sample rate setting
         response = self.instrument.query(':HORizontal:MODE:SAMPLERate?')
+        self.state.update('sample_rate', sample_rate, response.strip())
         return response.strip()
 
     def set_record_length(self, record_length):
-        self.instrument.write(f':HORizontal:RECOrdlength {record_length}')
-        self.instrument.query("*OPC?") #make sure operations are complete before continuing
+        if self.state.is_current('record_length', record_length):
+            return self.state.get('record_length')  # already set, answer the read-back locally
+        with self.batch():
+            self.instrument.write(f':HORizontal:RECOrdlength {record_length}')
+            self.instrument.query("*OPC?") #make sure operations are complete before continuing
         # Read back the record length setting
         response = self.instrument.query(':HORizontal:RECOrdlength?')
+        self.state.update('record_length', record_length, response.strip())
         return response.strip()
 
     def set_channels(self, channels, state):
@@ -35,32 +272,152 @@ class TektronixMSO68B:
         if state not in ["ON", "OFF"]:
             raise ValueError("Invalid state. Must be 'ON' or 'OFF'.")
 
-        # Determine unlisted channels and set them to OFF
-        unlisted_channels = valid_channels - set(channels)
-        for channel in unlisted_channels:
-            command = f"DISplay:GLObal:CH{channel}:STATE OFF"
-            self.instrument.write(command)
+        if self.state.is_current('channels', (frozenset(channels), state)):
+            return
 
-        # Set specified channels to the desired state
-        for channel in channels:
-            command = f"DISplay:GLObal:CH{channel}:STATE {state}"
-            self.instrument.write(command)
+        # All channel states go out as one message with a single *OPC? to make sure operations are complete
+        with self.batch(sync=True):
+            # Determine unlisted channels and set them to OFF
+            unlisted_channels = valid_channels - set(channels)
+            for channel in unlisted_channels:
+                command = f"DISplay:GLObal:CH{channel}:STATE OFF"
+                self.instrument.write(command)
 
-        self.instrument.query("*OPC?") #make sure operations are complete before continuing
+            # Set specified channels to the desired state
+            for channel in channels:
+                command = f"DISplay:GLObal:CH{channel}:STATE {state}"
+                self.instrument.write(command)
+        self.state.update('channels', (frozenset(channels), state))
 
 
     def identify(self):
         return self.instrument.query('*IDN?').strip()
 
+    def file_size(self, filename):
+        """
+        Look up the size of a file in the scope's current working directory.
+
+        Args:
+            filename (str): File name as listed by FILESystem:LDIR?
+
+        Returns:
+            int: File size in bytes
+        """
+        for entry in self.instrument.query('FILESystem:LDIR?').strip().split(','):
+            parts = entry.strip('"').split(';')
+            if parts[0] == filename:
+                return int(parts[2])
+        cwd = self.instrument.query('FILESystem:CWD?').strip()
+        raise FileNotFoundError(f'File "{filename}" not found on scope (path: {cwd})')
+
+    def read_file(self, filename, local_path, directory=None, chunk_size=16 * 1024 * 1024, progress=None):
+        """
+        Stream a scope-side file to a local file in fixed-size chunks.
+
+        Only one chunk is held in host memory at a time. The raw socket is used
+        when it is open, otherwise the VISA session.
+
+        Args:
+            filename (str): File name in the scope's working directory
+            local_path (str): Destination path on the host
+            directory (str): Scope directory to change to first, if given
+            chunk_size (int): Bytes per read
+            progress (callable): Called as progress(bytes_done, total_bytes, seconds) after each chunk
+
+        Returns:
+            int: Number of bytes transferred
+        """
+        if directory is not None:
+            self.instrument.write(f'FILESystem:CWD "{directory}"')
+        num_bytes = self.file_size(filename)
+        start_time = time.perf_counter()
+        done = 0
+        with open(local_path, 'wb') as f:
+            if self.socket is not None:
+                self.socket.write(f'FILESystem:READFile "{filename}"')
+                self.socket.write('!r')  # flag for scope to push the file to the socket
+                chunk = bytearray(min(chunk_size, max(num_bytes, 1)))
+                mv = memoryview(chunk)
+                while done < num_bytes:
+                    n = self.socket.read_into(mv[:min(len(chunk), num_bytes - done)])
+                    f.write(mv[:n])
+                    done += n
+                    if progress is not None:
+                        progress(done, num_bytes, time.perf_counter() - start_time)
+                if self.socket.read_bytes(1) != b'\n':
+                    raise ValueError("File transfer did not end with linefeed")
+            else:
+                self.instrument.write(f'FILESystem:READFile "{filename}"')
+                while done < num_bytes:
+                    data = self.instrument.read_bytes(min(chunk_size, num_bytes - done))
+                    f.write(data)
+                    done += len(data)
+                    if progress is not None:
+                        progress(done, num_bytes, time.perf_counter() - start_time)
+                if self.instrument.read_bytes(1) != b'\n':
+                    raise ValueError("File transfer did not end with linefeed")
+        elapsed = time.perf_counter() - start_time
+        print(f"Read {filename}: {done / 1e6:.1f} MB in {elapsed:.1f} s ({done / 1e6 / max(elapsed, 1e-9):.1f} MB/s)")
+        return done
+
+    def read_files(self, filenames, local_dir, directory=None, chunk_size=16 * 1024 * 1024, progress=None):
+        """
+        Stream several scope-side files back to back on the same session.
+
+        Args:
+            filenames (list): File names in the scope's working directory
+            local_dir (str): Destination directory on the host
+            directory (str): Scope directory to change to first, if given
+            chunk_size (int): Bytes per read
+            progress (callable): Passed to read_file() for every file
+
+        Returns:
+            list: Local paths of the written files
+        """
+        os.makedirs(local_dir, exist_ok=True)
+        if directory is not None:
+            self.instrument.write(f'FILESystem:CWD "{directory}"')
+        paths = []
+        for filename in filenames:
+            local_path = os.path.join(local_dir, filename)
+            self.read_file(filename, local_path, chunk_size=chunk_size, progress=progress)
+            paths.append(local_path)
+        return paths
+
     def close(self):
-        self.instrument.close()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None  # the VISA session stays in the process-wide pool for reuse
+
+    def recall_setup(self, setup_path, monitor=None):
+        """
+        Recall a setup file saved on the scope.
+
+        Args:
+            setup_path (str): Setup file path on the scope
+            monitor (CompletionMonitor): If given, return a future instead of blocking on *OPC?
+        """
+        # RECAll clears the cached settings, see CommandBatcher.RESET_COMMAND
+        if monitor is not None:
+            return monitor.watch(self.instrument, f':RECAll:SETUp "{setup_path}"')
+        with self.batch(sync=True):
+            self.instrument.write(f':RECAll:SETUp "{setup_path}"')
 
-    def recall_setup(self, setup_path):
-        self.instrument.write(f':RECAll:SETUp "{setup_path}"')
-        self.instrument.query("*OPC?")
+    def force_trigger(self, monitor=None, timeout=60):
+        """
+        Force a trigger.
 
-    def force_trigger(self):
+        Args:
+            monitor (CompletionMonitor): If given, return a future that resolves once the
+                forced acquisition has completed (ACQuire:NUMACq? has advanced)
+            timeout (float): Seconds before that future fails with TimeoutError
+        """
+        if monitor is None:
+            self.instrument.write("FPANEL:PRESS FORCETRIG")
+            return None
+        count = int(self.instrument.query('ACQuire:NUMACq?'))
         self.instrument.write("FPANEL:PRESS FORCETRIG")
+        return monitor.watch_condition(lambda: int(self.instrument.query('ACQuire:NUMACq?')) > count, timeout)
 
     def write(self, string):
         self.instrument.write(string)
@@ -68,18 +425,124 @@ class TektronixMSO68B:
     def query(self, string):
         return(self.instrument.query(string))
 
-    def clipcheck(self, channels):
+    def channel_settings(self, channels):
+        """
+        Read clipping state, scale, position and offset of several channels in one round trip.
+
+        Returns:
+            dict: channel -> (clipping, scale, position, offset)
+        """
+        queries = []
+        for channel in channels:
+            queries += [f'CH{channel}:CLIPping?', f'CH{channel}:SCAle?', f'CH{channel}:POSition?', f'CH{channel}:OFFSet?']
+        values = self.instrument.query(CommandBatcher.join(queries)).strip().split(';')
+        settings = {}
+        for i, channel in enumerate(channels):
+            clipping, scale, position, offset = values[4 * i:4 * i + 4]
+            settings[channel] = (bool(int(clipping)), float(scale), float(position), float(offset))
+        return settings
+
+    def measure_peaks(self, channels, num_points=100000):
+        """
+        Measure each channel's minimum and maximum in volts from a short curve.
+
+        Opens the raw socket if needed. DATa:STARt/STOP are restored afterwards.
+
+        Args:
+            channels (list): Channel numbers (1 to 8)
+            num_points (int): Record points fetched per channel
 
-        for channel in channels:  # cycle through all active channels
+        Returns:
+            dict: channel -> (min volts, max volts)
+        """
+        if self.socket is None:
+            self.open_socket()
+        record_length = int(self.socket.query('HORizontal:RECOrdlength?'))
+        start, stop = self.socket.query('DATa:STARt?;:DATa:STOP?').split(';')
+        try:
+            num_points = self.configure_curve(2, 1, min(num_points, record_length))
+            buffer = np.empty(num_points, dtype=self.curve_dtype)
+            peaks = {}
+            for channel in channels:
+                raw = self.fetch_curve(channel, out=buffer)
+                ymult, yzero, yoff = self.curve_scale()
+                peaks[channel] = tuple((float(level) - yoff) * ymult + yzero for level in (raw.min(), raw.max()))
+        finally:
+            self.socket.write(f'DATa:STARt {int(start)};:DATa:STOP {int(stop)}')
+        return peaks
 
-            while int(self.instrument.query(f'ch{channel}:clipping?')):  # if clipping for selected channel is true
-                scale = float(self.instrument.query(f'ch{channel}:scale?'))  # check current scale for selected channel
-                new_scale = scale * 1.20  # increase vertical scale by 25%
-                print(f"Clipping detected, scale changed to {new_scale}")
-                for channel in channels:
-                    self.instrument.write(f'ch{channel}:scale {new_scale}')  # set new vertical scale
-                    self.instrument.query('*opc?')  # sync to make sure scale is changed before next query
-                time.sleep()
+    def wait_for_acquisition(self, previous_count, timeout=5.0):
+        """Poll ACQuire:NUMACq? with backoff until it exceeds previous_count or timeout expires."""
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while time.monotonic() < deadline:
+            if int(self.instrument.query('ACQuire:NUMACq?')) > previous_count:
+                return True
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        return False
+
+    def autorange(self, channels, headroom=4.0, clip_step=2.0, common_scale=True, max_iterations=3):
+        """
+        Set vertical scales so no channel clips, converging in one or two iterations.
+
+        Clipping, scale, position and offset of all channels are read in one round trip.
+        The peak of each channel is also measured over the raw socket and the scale
+        that puts it at headroom divisions is computed directly; a clipped channel's
+        peak is unknown, so its scale is multiplied by clip_step instead, as is every
+        channel's if the socket cannot be opened. Scales are only ever increased, and
+        all channels are written in a single batch with one *OPC?. If no acquisition at
+        the new scales arrives (e.g. the scope is stopped or waiting for a trigger),
+        the clipping status cannot be rechecked and autorange stops there.
+
+        Args:
+            channels (list): Channel numbers (1 to 8)
+            headroom (float): Divisions from center the peak may reach (the screen is +/-5)
+            clip_step (float): Scale factor for channels that are clipping
+            common_scale (bool): Give every channel the largest computed scale, as clipcheck did
+            max_iterations (int): Upper bound on measure/set cycles
+
+        Returns:
+            dict: channel -> final scale
+        """
+        measure = True
+        for _ in range(max_iterations):
+            settings = self.channel_settings(channels)
+            peaks = {}
+            if measure:
+                try:
+                    peaks = self.measure_peaks(channels)
+                except OSError as e:
+                    print(f"Peak measurement unavailable ({e}), scaling clipped channels only")
+                    measure = False
+            targets = {}
+            for channel, (clipping, scale, position, offset) in settings.items():
+                if clipping:
+                    targets[channel] = scale * clip_step
+                elif channel in peaks:
+                    excursion = max(abs(volts - offset) for volts in peaks[channel])
+                    targets[channel] = max(scale, excursion / max(headroom - abs(position), 0.5))
+                else:
+                    targets[channel] = scale
+            if common_scale:
+                targets = dict.fromkeys(channels, max(targets.values()))
+            changed = {ch: new for ch, new in targets.items() if new > settings[ch][1] * (1 + 1e-6)}
+            if not changed:
+                return {ch: settings[ch][1] for ch in channels}
+            print(f"Clipping risk detected, scales changed to {changed}")
+            count = int(self.instrument.query('ACQuire:NUMACq?'))
+            with self.batch(sync=True):
+                for channel, scale in changed.items():
+                    self.instrument.write(f'CH{channel}:SCAle {scale:.6g}')
+            # clipping status is only valid for an acquisition at the new scale
+            if not self.wait_for_acquisition(count):
+                print("No new acquisition after changing scales, clipping not rechecked")
+                break
+        return {ch: scale for ch, (_, scale, _, _) in self.channel_settings(channels).items()}
+
+    def clipcheck(self, channels):
+        """Increase vertical scales until no channel clips, see autorange()."""
+        return self.autorange(channels)
 
 
 if __name__ == "__main__":
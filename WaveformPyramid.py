@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from wfmReader import read_wfm
+
+
+def open_source(source, frame=0):
+    """
+    Open a record lazily.
+
+    Args:
+        source (str): .wfm file, or .npy file as written by TektronixMSO68B.fetch_channels
+        frame (int): Frame of a .wfm file
+
+    Returns:
+        tuple: (1-D array-like of volts, tstart, tscale); .npy files get tstart 0 and tscale 1
+    """
+    if source.endswith('.npy'):
+        return np.load(source, mmap_mode='r'), 0.0, 1.0
+    waveform, tstart, tscale = read_wfm(source, lazy=True, dtype='float32', frames=slice(frame, frame + 1))[:3]
+    return WaveformColumn(waveform), tstart, tscale
+
+
+class WaveformColumn:
+    # One frame of a lazy Waveform as a 1-D sequence
+    def __init__(self, waveform):
+        self.waveform = waveform
+
+    def __len__(self):
+        return len(self.waveform)
+
+    def __getitem__(self, key):
+        return self.waveform[key, 0]
+
+
+class WaveformPyramid:
+    def __init__(self, path):
+        """
+        Min/max/RMS level-of-detail pyramid of one record, persisted as a .npz file.
+
+        Level k holds one (min, max, mean square) triple per base * factor**k samples.
+        Arrays are read from the .npz file only when a level is first used, so a view
+        touches one level of bins instead of the record itself.
+
+        Args:
+            path (str): Pyramid file written by build()
+        """
+        self.path = path
+        self.npz = np.load(path)
+        info = json.loads(str(self.npz['info']))
+        self.source = info['source']
+        self.frame = info['frame']
+        self.length = info['length']
+        self.tstart = info['tstart']
+        self.tscale = info['tscale']
+        self.base = info['base']
+        self.factor = info['factor']
+        self.num_levels = info['num_levels']
+        self.levels = {}
+        self.raw = None
+
+    @staticmethod
+    def build(source, path=None, frame=0, base=64, factor=8, min_bins=1024, chunk_size=1 << 24):
+        """
+        Build the pyramid of a record in one streaming pass.
+
+        Args:
+            source (str): .wfm or .npy file
+            path (str): Output .npz file, defaults to '{source}.f{frame}.lod.npz'
+            frame (int): Frame of a .wfm file
+            base (int): Samples per bin of level 0
+            factor (int): Bins of one level merged into one bin of the next
+            min_bins (int): Stop adding levels once a level has fewer bins than this
+            chunk_size (int): Samples read per block, rounded down to a multiple of base
+
+        Returns:
+            WaveformPyramid
+        """
+        path = path or f"{source}.f{frame}.lod.npz"
+        samples, tstart, tscale = open_source(source, frame)
+        length = len(samples)
+        num_bins = -(-length // base)
+        level = {name: np.empty(num_bins, dtype=np.float32) for name in ('min', 'max', 'ms')}
+        chunk_size = max(base, chunk_size // base * base)
+        for start in range(0, length, chunk_size):
+            block = np.asarray(samples[start:start + chunk_size], dtype=np.float32)
+            bins = slice(start // base, start // base + -(-len(block) // base))
+            full = len(block) // base * base
+            rows = block[:full].reshape(-1, base)
+            level['min'][bins][:len(rows)] = rows.min(axis=1)
+            level['max'][bins][:len(rows)] = rows.max(axis=1)
+            level['ms'][bins][:len(rows)] = np.einsum('ij,ij->i', rows, rows, dtype=np.float64) / base
+            if full < len(block):  # partial last bin
+                tail = block[full:]
+                level['min'][bins][-1], level['max'][bins][-1] = tail.min(), tail.max()
+                level['ms'][bins][-1] = np.dot(tail, tail) / len(tail)
+
+        arrays = {}
+        k = 0
+        while True:
+            for name, values in level.items():
+                arrays[f'{name}{k}'] = values
+            if len(level['min']) <= max(min_bins, 1):
+                break
+            # Merge `factor` bins; the last bin may cover fewer samples, which its mean square ignores
+            level = {'min': np.minimum.reduceat(level['min'], np.arange(0, len(level['min']), factor)),
+                     'max': np.maximum.reduceat(level['max'], np.arange(0, len(level['max']), factor)),
+                     'ms': np.add.reduceat(level['ms'], np.arange(0, len(level['ms']), factor), dtype=np.float64)
+                     / np.diff(np.r_[np.arange(0, len(level['ms']), factor), len(level['ms'])])}
+            level['ms'] = level['ms'].astype(np.float32)
+            k += 1
+
+        info = {'source': os.path.abspath(source), 'frame': frame, 'length': length, 'tstart': tstart,
+                'tscale': tscale, 'base': base, 'factor': factor, 'num_levels': k + 1}
+        with open(path, 'wb') as f:
+            np.savez(f, info=np.array(json.dumps(info)), **arrays)
+        return WaveformPyramid(path)
+
+    @staticmethod
+    def open(source, frame=0, **options):
+        """
+        Load the pyramid of a frame from next to source.
+
+        It is built first if it is missing, older than source, or was built with a
+        different base or factor than given in options.
+        """
+        path = f"{source}.f{frame}.lod.npz"
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+            pyramid = WaveformPyramid(path)
+            if pyramid.frame == frame and all(getattr(pyramid, name) == options[name]
+                                              for name in ('base', 'factor') if name in options):
+                return pyramid
+            pyramid.close()
+        return WaveformPyramid.build(source, path, frame, **options)
+
+    def level(self, k):
+        # (min, max, mean square) arrays of level k, read from the file on first use
+        if k not in self.levels:
+            self.levels[k] = tuple(self.npz[f'{name}{k}'] for name in ('min', 'max', 'ms'))
+        return self.levels[k]
+
+    def bin_size(self, k):
+        return self.base * self.factor ** k
+
+    def view(self, t0=None, t1=None, width=2000):
+        """
+        Envelope of the record between two times, at the coarsest detail that still gives width points.
+
+        When the window holds fewer than about width * base samples, the raw samples are read
+        from the source instead and returned as min = max = value.
+
+        Args:
+            t0, t1 (float): Window in seconds on the record's time axis, defaults to the whole record
+            width (int): Number of points wanted, e.g. the plot width in pixels
+
+        Returns:
+            tuple: (times, min, max, rms) arrays; times are bin centres
+        """
+        first = 0 if t0 is None else int(np.clip(np.floor((t0 - self.tstart) / self.tscale), 0, self.length))
+        last = self.length if t1 is None else int(np.clip(np.ceil((t1 - self.tstart) / self.tscale) + 1,
+                                                          first, self.length))
+        samples_per_point = (last - first) / max(width, 1)
+        k = int(np.floor(np.log(samples_per_point / self.base) / np.log(self.factor))) if samples_per_point >= self.base else -1
+        k = min(k, self.num_levels - 1)
+
+        if k < 0:
+            if self.raw is None:
+                self.raw = open_source(self.source, self.frame)[0]
+            values = np.asarray(self.raw[first:last], dtype=np.float32)
+            times = self.tstart + np.arange(first, last) * self.tscale
+            return times, values, values, np.abs(values)
+
+        size = self.bin_size(k)
+        lows, highs, ms = self.level(k)
+        bins = slice(first // size, -(-last // size))
+        centres = (np.arange(bins.start, bins.start + len(lows[bins])) + 0.5) * size
+        times = self.tstart + np.minimum(centres, self.length) * self.tscale
+        return times, lows[bins], highs[bins], np.sqrt(ms[bins])
+
+    def close(self):
+        self.npz.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quick-look viewer for long records using a min/max pyramid.")
+    parser.add_argument('source', help=".wfm or .npy file")
+    parser.add_argument('--frame', type=int, default=0)
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the pyramid even if it is up to date")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        pyramid = WaveformPyramid.build(args.source, frame=args.frame)
+    else:
+        pyramid = WaveformPyramid.open(args.source, frame=args.frame)
+
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    def redraw(axes=None):
+        t0, t1 = ax.get_xlim() if axes is not None else (None, None)
+        times, lows, highs, rms = pyramid.view(t0, t1, width=int(fig.get_figwidth() * fig.dpi))
+        for artist in list(ax.collections) + list(ax.lines):
+            artist.remove()
+        ax.fill_between(times, lows, highs, step='mid', linewidth=0, label='min/max')
+        ax.plot(times, rms, linewidth=0.8, color='C1', label='RMS')
+        ax.figure.canvas.draw_idle()
+
+    redraw()
+    ax.set_autoscalex_on(False)  # zooming sets the limits, redrawing must not change them
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Voltage')
+    ax.set_title(os.path.basename(args.source))
+    ax.grid(True)
+    ax.legend(loc='upper right')
+    ax.callbacks.connect('xlim_changed', redraw)
+    plt.show()
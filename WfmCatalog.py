@@ -0,0 +1,189 @@
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from WfmConverter import find_wfm_files
+from wfmReader import decode_header
+
+# Catalogue columns besides path, size and mtime, as (column, header field)
+COLUMNS = [
+    ('format', 'dformat'),
+    ('frames', 'Frames'),
+    ('fastframe', 'fastframe'),
+    ('samples', 'samples'),
+    ('vscale', 'vscale'),
+    ('voffset', 'voffset'),
+    ('tstart', 'tstart'),
+    ('tscale', 'tscale'),
+    ('tdate', 'tdate'),
+    ('tdatefrac', 'tdatefrac'),
+    ('curve_bytes', 'allbytes'),
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS headers (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    {', '.join(column for column, _ in COLUMNS)},
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS headers_tdate ON headers (tdate);
+CREATE INDEX IF NOT EXISTS headers_format ON headers (format, fastframe);
+"""
+
+
+def scan_header(path):
+    """
+    Read and decode only the 838-byte header of a .wfm file.
+
+    Returns:
+        dict: Catalogue row; 'error' holds the message if the header could not be decoded
+    """
+    stat = os.stat(path)
+    row = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'error': None}
+    try:
+        with open(path, 'rb') as f:
+            meta = decode_header(f.read(838))
+        row.update({column: meta[field] for column, field in COLUMNS})
+    except Exception as e:
+        row.update({column: None for column, _ in COLUMNS})
+        row['error'] = str(e)
+    return row
+
+
+def timestamp(value):
+    """Accept epoch seconds, a datetime or an ISO date string and return epoch seconds."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+class WfmCatalog:
+    def __init__(self, db_path='wfm_catalog.sqlite'):
+        """
+        SQLite index of .wfm header metadata, for finding captures without opening them.
+
+        Args:
+            db_path (str): Index file, created if it does not exist
+        """
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def scan(self, inputs, workers=16, prune=False):
+        """
+        Add new and changed .wfm files to the index, reading their headers in parallel.
+
+        Files whose size and modification time match the index are not opened again.
+
+        Args:
+            inputs (list): Directories (searched recursively), glob patterns or file paths
+            workers (int): Threads reading headers; header reads are I/O bound
+            prune (bool): Also drop index entries for files that no longer exist
+
+        Returns:
+            dict: Counts of 'scanned', 'unchanged', 'failed' and 'removed' files
+        """
+        known = {row['path']: (row['size'], row['mtime'])
+                 for row in self.db.execute('SELECT path, size, mtime FROM headers')}
+        files = find_wfm_files(inputs)
+        changed = []
+        for path in files:
+            stat = os.stat(path)
+            if known.get(path) != (stat.st_size, stat.st_mtime):
+                changed.append(path)
+
+        columns = ['path', 'size', 'mtime'] + [column for column, _ in COLUMNS] + ['error']
+        insert = (f"INSERT OR REPLACE INTO headers ({', '.join(columns)}) "
+                  f"VALUES ({', '.join(':' + column for column in columns)})")
+        stats = {'scanned': len(changed), 'unchanged': len(files) - len(changed), 'failed': 0, 'removed': 0}
+        with ThreadPoolExecutor(max_workers=workers) as pool, self.db:
+            for row in pool.map(scan_header, changed):
+                stats['failed'] += row['error'] is not None
+                self.db.execute(insert, row)
+
+        if prune:
+            missing = [(path,) for path in known if not os.path.exists(path)]
+            with self.db:
+                self.db.executemany('DELETE FROM headers WHERE path = ?', missing)
+            stats['removed'] = len(missing)
+        return stats
+
+    def find(self, dformat=None, fastframe=None, min_frames=None, since=None, until=None, path_like=None):
+        """
+        Look up captures by header metadata.
+
+        Args:
+            dformat (str): Sample type, 'int8', 'int16' or 'single'
+            fastframe (bool): Only FastFrame (True) or single-frame (False) captures
+            min_frames (int): Smallest number of frames
+            since, until: Trigger date range, as epoch seconds, datetime or ISO string
+            path_like (str): SQL LIKE pattern on the path (e.g., '%Dwell_3%')
+
+        Returns:
+            list: sqlite3.Row entries ordered by trigger date
+        """
+        conditions, params = ['error IS NULL'], []
+        if dformat is not None:
+            conditions.append('format = ?')
+            params.append(dformat)
+        if fastframe is not None:
+            conditions.append('fastframe = ?')
+            params.append(int(bool(fastframe)))
+        if min_frames is not None:
+            conditions.append('frames >= ?')
+            params.append(min_frames)
+        if since is not None:
+            conditions.append('tdate >= ?')
+            params.append(timestamp(since))
+        if until is not None:
+            conditions.append('tdate < ?')
+            params.append(timestamp(until))
+        if path_like is not None:
+            conditions.append('path LIKE ?')
+            params.append(path_like)
+        query = f"SELECT * FROM headers WHERE {' AND '.join(conditions)} ORDER BY tdate, tdatefrac"
+        return self.db.execute(query, params).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index .wfm headers in SQLite and search them.")
+    parser.add_argument('--db', default='wfm_catalog.sqlite', help="index file (default: wfm_catalog.sqlite)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    scan_parser = commands.add_parser('scan', help="add new and changed files to the index")
+    scan_parser.add_argument('inputs', nargs='+', help="directories, glob patterns or .wfm files")
+    scan_parser.add_argument('--workers', type=int, default=16, help="header reading threads (default: 16)")
+    scan_parser.add_argument('--prune', action='store_true', help="drop entries for deleted files")
+    find_parser = commands.add_parser('find', help="list indexed captures")
+    find_parser.add_argument('--format', choices=['int8', 'int16', 'single'])
+    find_parser.add_argument('--fastframe', action='store_true', help="only FastFrame captures")
+    find_parser.add_argument('--min-frames', type=int)
+    find_parser.add_argument('--since', help="ISO date or time, e.g. 2024-05-14")
+    find_parser.add_argument('--until', help="ISO date or time")
+    find_parser.add_argument('--path', help="SQL LIKE pattern on the path")
+    args = parser.parse_args()
+
+    catalog = WfmCatalog(args.db)
+    try:
+        if args.command == 'scan':
+            stats = catalog.scan(args.inputs, args.workers, args.prune)
+            print(f"{stats['scanned']} scanned ({stats['failed']} unreadable), {stats['unchanged']} unchanged, "
+                  f"{stats['removed']} removed")
+        else:
+            rows = catalog.find(args.format, True if args.fastframe else None, args.min_frames,
+                                args.since, args.until, args.path)
+            for row in rows:
+                date = datetime.fromtimestamp(row['tdate']).isoformat(sep=' ')
+                print(f"{date}  {row['format']:<6} {row['frames']:>6} frames {row['samples']:>11} samples  {row['path']}")
+            print(f"{len(rows)} captures")
+    finally:
+        catalog.close()
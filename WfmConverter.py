@@ -0,0 +1,159 @@
+import argparse
+import glob
+import importlib.util
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from wfmReader import read_wfm
+
+FORMATS = {'mat': '.mat', 'npy': '.npy', 'h5': '.h5'}
+
+
+def find_wfm_files(inputs):
+    """
+    Expand directories and glob patterns into a sorted list of .wfm files.
+
+    Args:
+        inputs (list): Directories (searched recursively), glob patterns or file paths
+    """
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            files.update(glob.glob(os.path.join(item, '**', '*.wfm'), recursive=True))
+        else:
+            files.update(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+    return sorted(files)
+
+
+def output_path(source, fmt='mat', output_dir=None):
+    """Output file for a .wfm file: same name with the format's extension, next to it or in output_dir."""
+    base = os.path.splitext(os.path.basename(source))[0] + FORMATS[fmt]
+    return os.path.join(output_dir or os.path.dirname(source), base)
+
+
+def is_up_to_date(source, target):
+    """True if target exists and is not older than source."""
+    return os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+
+
+def write_output(path, fmt, waveform, tstart, tscale, tfrac_array, tdatefrac_array, tdate_array, chunk_size=1 << 22):
+    # npy and h5 are filled block by block from the memory-mapped waveform; savemat needs the whole array
+    fields = {'tstart': tstart, 'tscale': tscale, 'tfrac_array': tfrac_array,
+              'tdatefrac_array': tdatefrac_array, 'tdate_array': tdate_array}
+    if fmt == 'mat':
+        from scipy import io
+        io.savemat(path, {'scaled_array': np.asarray(waveform), **fields})
+    elif fmt == 'npy':
+        # waveform only; use mat or h5 to keep the timestamps
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=waveform.dtype, shape=waveform.shape)
+        for start, block in waveform.chunks(chunk_size):
+            out[start:start + len(block)] = block
+        out.flush()
+        del out
+    else:
+        import h5py
+        with h5py.File(path, 'w') as f:
+            dataset = f.create_dataset('scaled_array', shape=waveform.shape, dtype=waveform.dtype, chunks=True)
+            for start, block in waveform.chunks(chunk_size):
+                dataset[start:start + len(block)] = block
+            for name, value in fields.items():
+                f[name] = value
+
+
+def convert_file(source, fmt='mat', output_dir=None, force=False, dtype='float64'):
+    """
+    Convert one .wfm file, skipping it if the output is already up to date.
+
+    The output is written to a temporary name and renamed when complete, so an
+    interrupted conversion is never mistaken for a finished one.
+
+    Returns:
+        tuple: (source, output path, bytes read or 0 if skipped, seconds)
+    """
+    target = output_path(source, fmt, output_dir)
+    if not force and is_up_to_date(source, target):
+        return source, target, 0, 0.0
+    start = time.perf_counter()
+    data = read_wfm(source, lazy=True, dtype=dtype)
+    root, ext = os.path.splitext(target)
+    partial = root + '.part' + ext  # keep the extension, savemat would append one
+    try:
+        write_output(partial, fmt, *data)
+        os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return source, target, os.path.getsize(source), time.perf_counter() - start
+
+
+def convert_files(inputs, fmt='mat', output_dir=None, workers=None, force=False, dtype='float64'):
+    """
+    Convert every .wfm file found in inputs across a process pool and print throughput statistics.
+
+    Args:
+        inputs (list): Directories, glob patterns or file paths
+        fmt (str): Output format, one of 'mat', 'npy' or 'h5'
+        output_dir (str): Directory for the outputs, defaults to next to each .wfm file
+        workers (int): Worker processes, defaults to the number of CPUs
+        force (bool): Convert files even if their outputs are up to date
+        dtype (str): Type of the scaled samples, 'float64' or 'float32'
+
+    Returns:
+        dict: Counts of 'converted', 'skipped' and 'failed' files, and 'bytes' read
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    # Fail before starting the pool if the writer for the format is missing
+    writer = {'mat': 'scipy', 'h5': 'h5py'}.get(fmt)
+    if writer is not None and importlib.util.find_spec(writer) is None:
+        raise ImportError(f"Writing {fmt} files needs {writer}")
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    files = find_wfm_files(inputs)
+    stats = {'converted': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+    if not files:
+        print("No .wfm files found.")
+        return stats
+    targets = [output_path(path, fmt, output_dir) for path in files]
+    if len(set(targets)) != len(targets):
+        raise ValueError("Several .wfm files have the same name; convert them next to their sources instead")
+
+    start = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(convert_file, path, fmt, output_dir, force, dtype): path for path in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                source, target, size, seconds = future.result()
+            except Exception as e:
+                stats['failed'] += 1
+                print(f"[{done}/{len(files)}] Error converting {futures[future]}: {e}")
+                continue
+            if size == 0:
+                stats['skipped'] += 1
+                continue
+            stats['converted'] += 1
+            stats['bytes'] += size
+            print(f"[{done}/{len(files)}] {source} -> {target} ({size / 1e6:.1f} MB in {seconds:.2f} s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"{stats['converted']} converted, {stats['skipped']} up to date, {stats['failed']} failed "
+          f"in {elapsed:.1f} s with {workers} workers: {stats['converted'] / elapsed:.1f} files/s, "
+          f"{stats['bytes'] / 1e6 / elapsed:.1f} MB/s")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert directories of Tektronix .wfm files in parallel.")
+    parser.add_argument('inputs', nargs='+', help="directories, glob patterns or .wfm files")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='mat', help="output format (default: mat)")
+    parser.add_argument('--output-dir', help="write outputs here instead of next to each .wfm file")
+    parser.add_argument('--workers', type=int, help="worker processes (default: number of CPUs)")
+    parser.add_argument('--force', action='store_true', help="convert files even if the output is up to date")
+    parser.add_argument('--float32', action='store_true', help="store samples as float32 instead of float64")
+    args = parser.parse_args()
+    convert_files(args.inputs, args.format, args.output_dir, args.workers, args.force,
+                  'float32' if args.float32 else 'float64')
@@ -0,0 +1,166 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import fft, signal
+
+from wfmReader import read_wfm
+
+
+def segment_powers(path, frame, first, count, hop, nperseg, window, detrend, average, dtype='float32', batch=64):
+    """
+    Sum |FFT|^2 over a run of segments of one frame, reading only the samples they cover.
+
+    Runs in a worker process. Segments are processed batch by batch, so memory stays at
+    about batch * nperseg samples however long the record is.
+
+    Args:
+        path (str): .wfm file
+        frame (int): Frame to analyse
+        first (int): Index of the first segment
+        count (int): Number of segments, a multiple of average
+        hop (int): Samples between segment starts
+        nperseg (int): Samples per segment
+        window (numpy.ndarray): Window applied to each segment
+        detrend (bool): Subtract the mean of each segment first
+        average (int): Segments summed into each output row
+
+    Returns:
+        numpy.ndarray: Power sums, shape (count // average, nperseg // 2 + 1)
+    """
+    waveform = read_wfm(path, lazy=True, dtype=dtype, frames=slice(frame, frame + 1))[0]
+    sums = np.zeros((count // average, nperseg // 2 + 1))
+    for offset in range(0, count, batch):
+        n = min(batch, count - offset)
+        start = (first + offset) * hop
+        block = waveform[start:start + (n - 1) * hop + nperseg, 0]
+        segments = np.lib.stride_tricks.sliding_window_view(block, nperseg)[::hop]
+        if detrend:
+            segments = segments - segments.mean(axis=1, keepdims=True)
+        spectra = fft.rfft(segments * window.astype(block.dtype), axis=1)
+        power = spectra.real ** 2 + spectra.imag ** 2
+        rows = np.arange(offset, offset + n) // average
+        starts = np.r_[0, np.flatnonzero(np.diff(rows)) + 1]
+        sums[rows[starts]] += np.add.reduceat(power, starts, axis=0)
+    return sums
+
+
+def run_segments(path, nperseg, noverlap, window, detrend, average, frame=0, workers=None, dtype='float32'):
+    """
+    Split a record into segments and compute their power sums across a process pool.
+
+    Returns:
+        tuple: (power sums per output row, segments per row, hop, window array, tstart, tscale)
+    """
+    waveform, tstart, tscale = read_wfm(path, lazy=True, frames=slice(frame, frame + 1))[:3]
+    num_points = len(waveform)
+    if not 0 <= noverlap < nperseg <= num_points:
+        raise ValueError(f"Need 0 <= noverlap < nperseg <= record length ({num_points})")
+    hop = nperseg - noverlap
+    num_segments = (num_points - nperseg) // hop + 1
+    num_rows = num_segments // average
+    if num_rows == 0:
+        raise ValueError(f"Record has {num_segments} segments, fewer than the {average} to average")
+    window = signal.get_window(window, nperseg)
+
+    # Several tasks per worker keep the pool busy; each task covers whole output rows
+    workers = workers or os.cpu_count() or 1
+    rows_per_task = max(1, -(-num_rows // (4 * workers)))
+    tasks = [(path, frame, row * average, min(rows_per_task, num_rows - row) * average, hop, nperseg,
+              window, detrend, average, dtype) for row in range(0, num_rows, rows_per_task)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        sums = np.vstack(list(pool.map(segment_powers, *zip(*tasks))))
+    return sums, average, hop, window, tstart, tscale
+
+
+def scale_power(power, window, fs, scaling):
+    # One-sided density (V^2/Hz) or power spectrum (V^2), as in scipy.signal.welch
+    if scaling == 'density':
+        power = power / (fs * (window ** 2).sum())
+    elif scaling == 'spectrum':
+        power = power / window.sum() ** 2
+    else:
+        raise ValueError(f"Unknown scaling: {scaling}")
+    nperseg = len(window)
+    power[..., 1:nperseg // 2 + (nperseg % 2)] *= 2  # DC and an even Nyquist bin are not doubled
+    return power
+
+
+def welch_psd(path, nperseg=65536, noverlap=None, window='hann', frame=0, scaling='density',
+              detrend=True, workers=None, dtype='float32'):
+    """
+    Welch power spectral density of one frame of a .wfm file.
+
+    Args:
+        path (str): .wfm file
+        nperseg (int): Samples per segment
+        noverlap (int): Overlapping samples between segments, defaults to nperseg // 2
+        window (str or tuple): Window name for scipy.signal.get_window
+        frame (int): Frame to analyse
+        scaling (str): 'density' for V^2/Hz, 'spectrum' for V^2
+        detrend (bool): Subtract the mean of each segment
+        workers (int): Worker processes, defaults to the number of CPUs
+        dtype (str): Working precision of the samples, 'float32' or 'float64'
+
+    Returns:
+        tuple: (frequencies in Hz, PSD)
+    """
+    noverlap = nperseg // 2 if noverlap is None else noverlap
+    sums, _, hop, window, _, tscale = run_segments(path, nperseg, noverlap, window, detrend, 1, frame,
+                                                   workers, dtype)
+    fs = 1 / tscale
+    return fft.rfftfreq(nperseg, tscale), scale_power(sums.sum(axis=0) / len(sums), window, fs, scaling)
+
+
+def averaged_fft(path, nfft=65536, window='hann', frame=0, workers=None, dtype='float32'):
+    """
+    Power spectrum (V^2 per bin) averaged over consecutive, non-overlapping blocks of nfft samples.
+
+    Returns:
+        tuple: (frequencies in Hz, power spectrum)
+    """
+    return welch_psd(path, nfft, 0, window, frame, 'spectrum', True, workers, dtype)
+
+
+def spectrogram(path, nperseg=4096, noverlap=None, window='hann', frame=0, average=1, scaling='density',
+                detrend=True, workers=None, dtype='float32'):
+    """
+    Spectrogram of one frame of a .wfm file.
+
+    Args:
+        average (int): Consecutive segments averaged into each time column, which bounds
+            the output size for long records
+        other arguments: See welch_psd()
+
+    Returns:
+        tuple: (frequencies in Hz, column center times in s, power of shape (frequencies, times))
+    """
+    noverlap = nperseg // 8 if noverlap is None else noverlap
+    sums, average, hop, window, tstart, tscale = run_segments(path, nperseg, noverlap, window, detrend,
+                                                              average, frame, workers, dtype)
+    power = scale_power(sums / average, window, 1 / tscale, scaling)
+    centers = np.arange(len(sums)) * average * hop + ((average - 1) * hop + nperseg) / 2
+    return fft.rfftfreq(nperseg, tscale), tstart + centers * tscale, power.T
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Welch PSD of a .wfm file, computed in chunks.")
+    parser.add_argument('path', help=".wfm file")
+    parser.add_argument('--nperseg', type=int, default=65536)
+    parser.add_argument('--frame', type=int, default=0)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--plot', action='store_true', help="plot the PSD in dB")
+    args = parser.parse_args()
+
+    freqs, psd = welch_psd(args.path, args.nperseg, frame=args.frame, workers=args.workers)
+    peak = np.argmax(psd[1:]) + 1
+    print(f"{len(freqs)} bins of {freqs[1]:.1f} Hz, peak {10 * np.log10(psd[peak]):.1f} dB(V^2/Hz) "
+          f"at {freqs[peak] / 1e6:.3f} MHz")
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.plot(freqs / 1e6, 10 * np.log10(psd))
+        plt.xlabel('Frequency (MHz)')
+        plt.ylabel('PSD (dB V^2/Hz)')
+        plt.grid(True)
+        plt.show()
@@ -1,103 +1,314 @@
+import os
+import sys
 import time
 import configparser
-from BNC845M import BNC845M
-from DIOController import DIOController
-from NGP800PowerSupply import NGP800PowerSupply
-from SMW200A import SMW200A
-from TektronixMSO68B import TektronixMSO68B
+from CompletionMonitor import CompletionMonitor
+from DwellScheduler import DwellScheduler
+from FrequencyPlan import build_plan, optimize_order, plan_cost, set_instrument_parameters
 import logging
 import ast
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 
 # Set up logging configuration
 logging.basicConfig(filename='logs/instrument.log', level=logging.DEBUG,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def set_instrument_parameters(dwell_center_freq):
-    # Define default values
-    lo1, lo2, rfif = None, None, None
-
-    # Define conditions and outputs for each frequency range
-    if 500 <= dwell_center_freq <= 1000:
-        lo1, lo2, rfif = 4600, 5000, "RF1IF1"
-    elif 1000 < dwell_center_freq <= 1500:
-        lo1, lo2, rfif = 5100, 5000, "RF1IF1"
-    elif 1500 < dwell_center_freq <= 2000:
-        lo1, lo2, rfif = 5600, 5000, "RF1IF1"
-    elif 2000 < dwell_center_freq <= 2500:
-        lo1, lo2, rfif = 6100, 5000, "RF1IF1"
-    elif 2500 < dwell_center_freq <= 3000:
-        lo1, lo2, rfif = 9500, 7900, "RF2IF3"
-    elif 3000 < dwell_center_freq <= 3500:
-        lo1, lo2, rfif = 10000, 7900, "RF2IF3"
-    elif 3500 < dwell_center_freq <= 4000:
-        lo1, lo2, rfif = 10500, 7900, "RF2IF3"
-    elif 4000 < dwell_center_freq <= 4500:
-        lo1, lo2, rfif = 11000, 7900, "RF2IF3"
-    elif 4500 < dwell_center_freq <= 5000:
-        lo1, lo2, rfif = 11500, 7900, "RF2IF3"
-    elif 5000 < dwell_center_freq <= 5500:
-        lo1, lo2, rfif = 9000, 4900, "RF2IF3"
-    elif 5500 < dwell_center_freq <= 6000:
-        lo1, lo2, rfif = 9500, 4900, "RF3IF1"
-    elif 6000 < dwell_center_freq <= 6500:
-        lo1, lo2, rfif = 10000, 4900, "RF3IF1"
-    elif 6500 < dwell_center_freq <= 7000:
-        lo1, lo2, rfif = 10500, 4900, "RF3IF1"
-    elif 7000 < dwell_center_freq <= 7500:
-        lo1, lo2, rfif = 11000, 4900, "RF3IF1"
-    elif 7500 < dwell_center_freq <= 8000:
-        lo1, lo2, rfif = 11500, 4900, "RF3IF1"
-    elif 8000 < dwell_center_freq <= 8500:
-        lo1, lo2, rfif = 12500, 5400, "RF4IF2"
-    elif 8500 < dwell_center_freq <= 9000:
-        lo1, lo2, rfif = 13000, 5400, "RF4IF2"
-    elif 9000 < dwell_center_freq <= 9500:
-        lo1, lo2, rfif = 13500, 5400, "RF4IF2"
-    elif 9500 < dwell_center_freq <= 10000:
-        lo1, lo2, rfif = 14000, 5400, "RF4IF2"
-    elif 10000 < dwell_center_freq <= 10500:
-        lo1, lo2, rfif = 14500, 5400, "RF4IF2"
-    elif 10500 < dwell_center_freq <= 11000:
-        lo1, lo2, rfif = 15000, 5400, "RF4IF2"
-    elif 11000 < dwell_center_freq <= 11500:
-        lo1, lo2, rfif = 15500, 5400, "RF4IF2"
-    elif 11500 < dwell_center_freq <= 12000:
-        lo1, lo2, rfif = 16000, 5400, "RF4IF2"
-    elif 12000 < dwell_center_freq <= 12500:
-        lo1, lo2, rfif = 8500, 4900, "RF5IF1"
-    elif 12500 < dwell_center_freq <= 13000:
-        lo1, lo2, rfif = 9000, 4900, "RF5IF1"
-    elif 13000 < dwell_center_freq <= 13500:
-        lo1, lo2, rfif = 9500, 4900, "RF5IF1"
-    elif 13500 < dwell_center_freq <= 14000:
-        lo1, lo2, rfif = 10000, 4900, "RF5IF1"
-    elif 14000 < dwell_center_freq <= 14500:
-        lo1, lo2, rfif = 9800, 5600, "RF5IF2"
-    elif 14500 < dwell_center_freq <= 15000:
-        lo1, lo2, rfif = 10300, 5600, "RF5IF2"
-    elif 15000 < dwell_center_freq <= 15500:
-        lo1, lo2, rfif = 8500, 7900, "RF5IF3"
-    elif 15500 < dwell_center_freq <= 16000:
-        lo1, lo2, rfif = 9000, 7900, "RF5IF3"
-    elif 16000 < dwell_center_freq <= 16500:
-        lo1, lo2, rfif = 9500, 7900, "RF5IF3"
-    elif 16500 < dwell_center_freq <= 17000:
-        lo1, lo2, rfif = 10000, 7900, "RF5IF3"
-    elif 17000 < dwell_center_freq <= 17500:
-        lo1, lo2, rfif = 9800, 8600, "RF5IF4"
-    elif 17500 < dwell_center_freq <= 18000:
-        lo1, lo2, rfif = 10300, 8600, "RF5IF4"
-    else:
-        raise ValueError("Invalid center frequency value")
-
-    return lo1, lo2, rfif
+def retune_instruments(dwell_name, dwell_config, bnc1, bnc2, dio, smw200a):
+    """
+    Set the LOs, the DIO switching matrix and the calibration source for a dwell.
+
+    Args:
+        dwell_name (str): Dwell section name, used in log messages
+        dwell_config (configparser.SectionProxy): Dwell section to tune for
+        bnc1, bnc2 (BNC845M): Local oscillators, or None
+        dio (DIOController): Switching matrix, or None
+        smw200a (SMW200A): Calibration source, or None
+    """
+    lo1, lo2, rfif = set_instrument_parameters(dwell_config.getint('dwell_center_frequency'))
+
+    if bnc1 and bnc2:
+        with bnc1.batch():
+            bnc1.set_frequency(lo1 * 1e6)
+            bnc1.start_output()
+        with bnc2.batch():
+            bnc2.set_frequency(lo2 * 1e6)
+            bnc2.start_output()
+        logging.info(f"BNCs set to LO1={lo1}MHz, LO2={lo2}MHz for {dwell_name}.")
+        print(f"BNCs set to LO1={lo1}MHz, LO2={lo2}MHz.")
+
+    if dio:
+        if 'port_rfif' in dwell_config:
+            # Split-band dwell: one RF/IF combination per port
+            rfif = ast.literal_eval(dwell_config.get('port_rfif'))
+            dio.set_port_routing(rfif)
+        else:
+            dio.set_all_ports_rf_if_values(rfif)
+        dio.update_digital_output()
+        logging.info(f"DIO set for {rfif}.")
+        print(f"DIO set for {rfif}.")
+
+    if smw200a:
+        cal_freq = dwell_config.getint('cal_center_frequency')
+        cal_pwr = dwell_config.getint('cal_power')
+        with smw200a.batch():
+            smw200a.set_frequency(cal_freq * 1e6)
+            smw200a.set_power_level(cal_pwr)
+            smw200a.start_signal()
+        logging.info(f"SMW200A set to {cal_freq}MHz at {cal_pwr}dBm.")
+        print(f"SMW200A set to {cal_freq}MHz at {cal_pwr}dBm.")
+
+
+def run_on_scopes(scope_pool, scopes, func, *args):
+    """
+    Run func(name, scope, index, *args) for every scope concurrently and wait for all of them.
+
+    Args:
+        scope_pool (ThreadPoolExecutor): Pool with one worker per scope
+        scopes (list): (name, scope, index) tuples
+        func (callable): Per-scope job
+    """
+    futures = [scope_pool.submit(func, name, scope, n, *args) for name, scope, n in scopes]
+    wait(futures)  # join point: done only when every scope has finished
+    for future in futures:
+        future.result()  # re-raise the first scope error, if any
+
+
+def run_logged(description, func, *args, **kwargs):
+    """
+    Run an idle task, logging its error instead of raising it into the next dwell.
+
+    Returns:
+        bool: True if func completed
+    """
+    try:
+        func(*args, **kwargs)
+        return True
+    except Exception as e:
+        logging.error(f"{description} failed: {e}")
+        print(f"{description} failed: {e}")
+        return False
+
+
+def save_scope_data(name, scope, index, dwell_config, data_dir, prefix, ddc_bandwidth=None):
+    """
+    Download the channels of one scope's last acquisition to data_dir.
+
+    With ddc_bandwidth (Hz), each channel is downconverted to complex baseband around the
+    dwell's IF and only the decimated I/Q is saved, with the plan metadata in a .json file.
+    """
+    channels = ast.literal_eval(dwell_config.get(f'set_channels_{index}'))
+    transform = None
+    if ddc_bandwidth:
+        from Downconverter import plan_downconverter, save_metadata
+        sample_rate = float(scope.query(':HORizontal:MODE:SAMPLERate?'))  # the rate the scope actually used
+        ddc, metadata = plan_downconverter(dwell_config.getint('dwell_center_frequency'), sample_rate, ddc_bandwidth)
+        transform = ddc.downconvert
+    paths = scope.fetch_channels(channels, data_dir, prefix=f"{prefix}_{name}", transform=transform)
+    if ddc_bandwidth:
+        save_metadata(os.path.join(data_dir, f"{prefix}_{name}_iq.json"), metadata)  # data_dir exists by now
+    logging.info(f"{name} data saved: {', '.join(paths)}")
+
+
+def acquire_scope(name, scope, index, dwell_config, monitor):
+    """
+    Configure, clip-check and trigger one oscilloscope for a single repeat.
+
+    Args:
+        name (str): Label used in log and console messages (e.g., 'Tektronix1')
+        scope (TektronixMSO68B): Initialized oscilloscope
+        index (int): Scope number selecting the set_channels_N, sample_rate_N and record_length_N keys
+        dwell_config (configparser.SectionProxy): Current dwell section
+        monitor (CompletionMonitor): Tracks completion of the forced acquisition
+    """
+    channels = ast.literal_eval(dwell_config.get(f'set_channels_{index}'))
+    sample_rate = dwell_config.getint(f'sample_rate_{index}')
+    record_length = dwell_config.getint(f'record_length_{index}')
+    scope.set_channels(channels, "ON")
+    scope.set_sample_rate(sample_rate)
+    scope.set_record_length(record_length)
+    scope.clipcheck(channels)
+    acquisition = scope.force_trigger(monitor, timeout=30)
+    try:
+        acquisition.result()  # the monitor polls every scope's acquisition from one thread
+        logging.info(f"{name} triggered, acquisition complete.")
+    except TimeoutError:
+        logging.warning(f"{name} triggered, but no completed acquisition was seen.")
+    events = scope.query('ALLEV?').strip()  # ALLEV? clears the event queue, so read it once
+    logging.debug(f"{name} Events: {events}")
+    print(f"{name} Events: {events}")
+
+
+def shutdown_instrument(section, instrument):
+    """Switch off the outputs of one instrument and close it."""
+    if section == 'SMW200A':
+        instrument.stop_signal()
+    elif section.startswith('BNC845M'):
+        instrument.stop_output()
+    elif section == 'DIOController':
+        instrument.set_all_ports_rf_if_values("ALLOFF")
+        instrument.update_digital_output()
+    elif section == 'NGP800PowerSupply':
+        instrument.stop_output()
+    instrument.close()
+
+
+@contextmanager
+def shutdown_on_error(section, instrument):
+    # A driver that connected but failed to configure is shut down before the error propagates
+    try:
+        yield instrument
+    except Exception:
+        try:
+            shutdown_instrument(section, instrument)
+        except Exception as e:
+            logging.warning(f"Could not shut down half-initialized {section}: {e}")
+        raise
+
+
+# Driver modules are imported inside the initializers so that pyvisa, nidaqmx and numpy
+# only load for instruments that are enabled in the config.
+
+def init_ngp800(config, section, monitor):
+    from NGP800PowerSupply import NGP800PowerSupply
+    addr = config.get(section, 'resource_address')
+    ngp800 = NGP800PowerSupply(f"TCPIP0::{addr}::inst0::INSTR")
+    with shutdown_on_error(section, ngp800):
+        with ngp800.batch(sync=True):  # all channel settings and output on in one message
+            for i in range(1, 4):  # Configure channels 1, 2, 3
+                v = config.getfloat(section, f'Ch{i}_voltage')
+                c = config.getfloat(section, f'Ch{i}_current')
+                ngp800.configure_channel(i, v, c)
+            ngp800.start_output()
+    return ngp800
+
+
+def init_smw200a(config, section, monitor):
+    from SMW200A import SMW200A
+    addr = config.get(section, 'resource_address')
+    smw200a = SMW200A(f"TCPIP0::{addr}::inst0::INSTR")
+    with shutdown_on_error(section, smw200a):
+        smw200a.identify()
+    return smw200a
+
+
+def init_bnc845m(config, section, monitor):
+    from BNC845M import BNC845M
+    addr = config.get(section, 'resource_address')
+    pwr = config.getint(section, 'power_level')
+    bnc = BNC845M(f"TCPIP0::{addr}::inst0::INSTR")
+    with shutdown_on_error(section, bnc):
+        bnc.set_power_level(power_level=pwr)
+        bnc.identify()
+    return bnc
+
+
+def init_dio(config, section, monitor):
+    from DIOController import DIOController
+    backend = None
+    if config.getboolean(section, 'simulate', fallback=False):
+        import SimulatedDAQ as backend  # run the switching logic without the USB-6509
+    return DIOController(config.get(section, 'resource_name'), backend=backend)
+
+
+def init_scope(config, section, monitor):
+    from TektronixMSO68B import TektronixMSO68B
+    addr = config.get(section, 'resource_address')
+    path = config.get(section, 'settings_path')
+    scope = TektronixMSO68B(f"TCPIP0::{addr}::inst0::INSTR")
+    with shutdown_on_error(section, scope):
+        scope.recall_setup(path, monitor).result(timeout=120)  # raises OperationError if the recall fails
+        logging.info(f"{section} identified: {scope.identify()}")
+    return scope
+
+
+# Instrument bring-up in dependency order: the supplies power the rest, everything after them starts at once
+BRING_UP_STAGES = [
+    {'NGP800PowerSupply': init_ngp800},
+    {'SMW200A': init_smw200a, 'BNC845M_1': init_bnc845m, 'BNC845M_2': init_bnc845m,
+     'DIOController': init_dio, 'TektronixMSO68B_1': init_scope, 'TektronixMSO68B_2': init_scope},
+]
+
+# Sources and switches go off first, the supplies last
+SHUTDOWN_ORDER = ['SMW200A', 'BNC845M_1', 'BNC845M_2', 'DIOController',
+                  'TektronixMSO68B_1', 'TektronixMSO68B_2', 'NGP800PowerSupply']
+
+
+def bring_up(config, monitor, instruments):
+    """
+    Initialize the configured instruments stage by stage, each stage in parallel.
+
+    A stage only starts if every instrument of the stages before it came up;
+    otherwise its instruments are reported as skipped.
+
+    Args:
+        config (configparser.ConfigParser): Parsed config.ini
+        monitor (CompletionMonitor): Tracks scope setup recalls
+        instruments (dict): Filled with section -> instrument, or None if it failed to initialize
+
+    Returns:
+        list: Readiness report rows of (section, status, seconds, detail)
+    """
+    report = []
+    failed = []
+
+    def start(section, initializer):
+        start_time = time.perf_counter()
+        try:
+            instruments[section] = initializer(config, section, monitor)
+            logging.info(f"[OK] {section} initialized.")
+            return section, 'OK', time.perf_counter() - start_time, ''
+        except Exception as e:
+            instruments[section] = None
+            logging.error(f"Failed to initialize {section}: {e}")
+            return section, 'FAILED', time.perf_counter() - start_time, str(e)
+
+    for stage in BRING_UP_STAGES:
+        enabled = {}
+        for section, initializer in stage.items():
+            if config.has_section(section):
+                enabled[section] = initializer
+            else:
+                logging.warning(f"[SKIP] {section} section not found in config.")
+                report.append((section, 'SKIP', 0.0, 'section not found in config'))
+        if failed:
+            for section in enabled:
+                instruments[section] = None
+                logging.error(f"[SKIP] {section} not started, {', '.join(failed)} failed.")
+                report.append((section, 'SKIP', 0.0, f"{', '.join(failed)} failed"))
+            continue
+        if 'DIOController' in enabled:
+            input("Switch on junction box switches from left to right. Press Enter to proceed...")
+        with ThreadPoolExecutor(max_workers=max(len(enabled), 1)) as pool:
+            results = list(pool.map(lambda item: start(*item), enabled.items()))
+        report += results
+        failed += [section for section, status, _, _ in results if status == 'FAILED']
+    return report
+
+
+def dry_run(config_path='config.ini'):
+    """Print the dwell plan from the config without loading any instrument driver."""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    plan = build_plan(config)
+    if config.getboolean('General', 'optimize_dwell_order', fallback=False):
+        plan = optimize_order(plan)
+    enabled = [section for stage in BRING_UP_STAGES for section in stage if config.has_section(section)]
+    print(f"Enabled instruments: {', '.join(enabled) or 'none'}")
+    print(f"Estimated retune settle time: {plan_cost(plan):.2f} s")
+    for entry in plan:
+        repeats = config.getint(entry['dwell'], 'repeat_count')
+        print(f"  {entry['dwell']:<10} {entry['frequency']:>6} MHz  LO1={entry['lo1']} MHz  "
+              f"LO2={entry['lo2']} MHz  {entry['rfif']}  x{repeats}")
 
 
 def main():
-    # Initialize all potential instrument objects to None.
-    # This allows us to safely check if they were initialized later.
-    ngp800, smw200a, bnc1, bnc2, dio, tektronix1, tektronix2 = None, None, None, None, None, None, None
+    # Instruments by config section, filled during bring-up.
+    # This allows us to safely shut down whatever was initialized, even after a partial start-up.
+    instruments = {}
+    scope_pool = None
+    monitor = CompletionMonitor()
 
     try:
         config = configparser.ConfigParser()
@@ -105,128 +316,25 @@ def main():
 
         # --- General Config ---
         dwell_spacing = config.getint('General', 'dwell_spacing', fallback=60)
+        optimize_dwell_order = config.getboolean('General', 'optimize_dwell_order', fallback=False)
+        data_dir = config.get('General', 'data_dir', fallback=None)  # download scope data when set
+        ddc_bandwidth = config.getfloat('General', 'ddc_bandwidth', fallback=None)  # store I/Q instead of IF when set
 
         # --- Initialize Instruments Conditionally ---
         print("Initializing instruments...")
-
-        # NGP800PowerSupply
-        if config.has_section('NGP800PowerSupply'):
-            try:
-                addr = config.get('NGP800PowerSupply', 'resource_address')
-                ngp800 = NGP800PowerSupply(f"TCPIP0::{addr}::inst0::INSTR")
-                for i in range(1, 4):  # Configure channels 1, 2, 3
-                    v = config.getfloat('NGP800PowerSupply', f'Ch{i}_voltage')
-                    c = config.getfloat('NGP800PowerSupply', f'Ch{i}_current')
-                    ngp800.configure_channel(i, v, c)
-                ngp800.start_output()
-                logging.info("[OK] NGP800PowerSupply initialized and configured.")
-                print("NGP800 Power Supply successfully initialized.")
-            except Exception as e:
-                logging.error(f"Failed to initialize NGP800PowerSupply: {e}")
-                print("Failed to initialize NGP800 Power Supply.")
-                ngp800 = None
-        else:
-            logging.warning("[SKIP] NGP800PowerSupply section not found in config.")
-            print("Skipping NGP800 Power Supply: section not found in config.")
-
-        # SMW200A
-        if config.has_section('SMW200A'):
-            try:
-                addr = config.get('SMW200A', 'resource_address')
-                smw200a = SMW200A(f"TCPIP0::{addr}::inst0::INSTR")
-                logging.info(f"[OK] SMW200A initialized: {smw200a.identify()}")
-                print("SMW200A Signal Generator successfully initialized.")
-            except Exception as e:
-                logging.error(f"Failed to initialize SMW200A: {e}")
-                print("Failed to initialize SMW200A Signal Generator")
-                smw200a = None
-        else:
-            logging.warning("[SKIP] SMW200A section not found in config.")
-            print("Skipping SMW200A Signal Generator: section not found in config.")
-
-        # BNC845M_1
-        if config.has_section('BNC845M_1'):
-            try:
-                addr = config.get('BNC845M_1', 'resource_address')
-                pwr = config.getint('BNC845M_1', 'power_level')
-                bnc1 = BNC845M(f"TCPIP0::{addr}::inst0::INSTR")
-                bnc1.set_power_level(power_level=pwr)
-                logging.info(f"[OK] BNC845M_1 initialized: {bnc1.identify()}")
-                print("BNC845M_1 Local Oscillator successfully initialized.")
-            except Exception as e:
-                logging.error(f"Failed to initialize BNC845M_1: {e}")
-                print("Failed to initialize BNC845M_1 Local Oscillator")
-                bnc1 = None
-        else:
-            logging.warning("[SKIP] BNC845M_1 section not found in config.")
-            print("Skipping BNC845M_1 Local Oscillator: section not found in config.")
-
-        # BNC845M_2
-        if config.has_section('BNC845M_2'):
-            try:
-                addr = config.get('BNC845M_2', 'resource_address')
-                pwr = config.getint('BNC845M_2', 'power_level')
-                bnc2 = BNC845M(f"TCPIP0::{addr}::inst0::INSTR")
-                bnc2.set_power_level(power_level=pwr)
-                logging.info(f"[OK] BNC845M_2 initialized: {bnc2.identify()}")
-                print("BNC845M_2 Local Oscillator successfully initialized.")
-            except Exception as e:
-                logging.error(f"Failed to initialize BNC845M_2: {e}")
-                print("Failed to initialize BNC845M_2 Local Oscillator")
-                bnc2 = None
-        else:
-            logging.warning("[SKIP] BNC845M_2 section not found in config.")
-            print("Skipping BNC845M_2 Local Oscillator: section not found in config.")
-
-        # DIOController
-        if config.has_section('DIOController'):
-            input("Switch on junction box switches from left to right. Press Enter to proceed...")
-            try:
-                name = config.get('DIOController', 'resource_name')
-                dio = DIOController(name)
-                logging.info(f"[OK] DIOController initialized for {name}.")
-                print(f"DIOController successfully initialized for {name}.")
-            except Exception as e:
-                logging.error(f"Failed to initialize DIOController: {e}")
-                print(f"Failed to initialize DIOController: {e}")
-                dio = None
-        else:
-            logging.warning("[SKIP] DIOController section not found in config.")
-            print("Skipping DIOController: section not found in config.")
-
-        # TektronixMSO68B_1
-        if config.has_section('TektronixMSO68B_1'):
-            try:
-                addr = config.get('TektronixMSO68B_1', 'resource_address')
-                path = config.get('TektronixMSO68B_1', 'settings_path')
-                tektronix1 = TektronixMSO68B(f"TCPIP0::{addr}::inst0::INSTR")
-                tektronix1.recall_setup(path)
-                logging.info(f"[OK] TektronixMSO68B_1 initialized: {tektronix1.identify()}")
-                print("TektronixMSO68B_1 Oscilloscope successfully initialized.")
-            except Exception as e:
-                logging.error(f"Failed to initialize TektronixMSO68B_1: {e}")
-                print(f"Failed to initialize TektronixMSO68B_1: {e}")
-                tektronix1 = None
-        else:
-            logging.warning("[SKIP] TektronixMSO68B_1 section not found in config.")
-            print("Skipping TektronixMSO68B_1: section not found in config.")
-
-        # TektronixMSO68B_2
-        if config.has_section('TektronixMSO68B_2'):
-            try:
-                addr = config.get('TektronixMSO68B_2', 'resource_address')
-                path = config.get('TektronixMSO68B_2', 'settings_path')
-                tektronix2 = TektronixMSO68B(f"TCPIP0::{addr}::inst0::INSTR")
-                tektronix2.recall_setup(path)
-                logging.info(f"[OK] TektronixMSO68B_2 initialized: {tektronix2.identify()}")
-                print("TektronixMSO68B_2 Oscilloscope successfully initialized.")
-            except Exception as e:
-                logging.error(f"Failed to initialize TektronixMSO68B_2: {e}")
-                print(f"Failed to initialize TektronixMSO68B_2: {e}")
-                tektronix2 = None
-        else:
-            logging.warning("[SKIP] TektronixMSO68B_2 section not found in config.")
-            print("Skipping TektronixMSO68B_2: section not found in config.")
+        start_time = time.perf_counter()
+        report = bring_up(config, monitor, instruments)
+        ngp800 = instruments.get('NGP800PowerSupply')
+        smw200a = instruments.get('SMW200A')
+        bnc1, bnc2 = instruments.get('BNC845M_1'), instruments.get('BNC845M_2')
+        dio = instruments.get('DIOController')
+        tektronix1, tektronix2 = instruments.get('TektronixMSO68B_1'), instruments.get('TektronixMSO68B_2')
+
+        print(f"Instrument readiness ({time.perf_counter() - start_time:.1f} s):")
+        for section, status, seconds, detail in report:
+            line = f"  {section:<18} {status:<6} {seconds:6.1f} s  {detail}"
+            logging.info(f"Readiness: {line.strip()}")
+            print(line)
 
         # --- Main loop for dwells ---
 
@@ -248,71 +356,58 @@ def main():
             print(f"ERROR: Missing critical instruments: {', '.join(uninitialized)}. Aborting test.")
             return  # Exit the main() function before entering the dwell loop
 
-        dwell_sections = [s for s in config.sections() if s.startswith('Dwell_')]
-        for dwell_name in dwell_sections:
+        # Scopes are driven concurrently, one worker each, and joined at the end of every repeat
+        scopes = [(f"Tektronix{n}", scope, n) for n, scope in enumerate((tektronix1, tektronix2), start=1) if scope]
+        scope_pool = ThreadPoolExecutor(max_workers=max(len(scopes), 1))
+
+        # Repeats start on a fixed grid of dwell_spacing seconds. The gap after each repeat is used to
+        # download its data and, after the last repeat of a dwell, to retune for the next dwell.
+        scheduler = DwellScheduler(dwell_spacing)
+        tuned_dwell = None
+
+        def retune_ahead(name):
+            # Idle task: tune for the next dwell now; if it fails, that dwell retunes itself at its start
+            nonlocal tuned_dwell
+            if run_logged(f"Retune for {name}", retune_instruments, name, config[name], bnc1, bnc2, dio, smw200a):
+                tuned_dwell = name
+
+        # Tuning for every dwell is looked up once; optionally reorder dwells to minimize retune settling
+        plan = build_plan(config)
+        if optimize_dwell_order:
+            optimized = optimize_order(plan)
+            logging.info(f"Dwell order optimized: settle time {plan_cost(plan):.2f} s -> {plan_cost(optimized):.2f} s")
+            plan = optimized
+        dwell_sections = [entry['dwell'] for entry in plan]
+        logging.info(f"Dwell order: {', '.join(dwell_sections)}")
+
+        for dwell_index, dwell_name in enumerate(dwell_sections):
             try:
                 dwell_config = config[dwell_name]
                 repeat_count = dwell_config.getint('repeat_count')
-                dwell_center_freq = dwell_config.getint('dwell_center_frequency')
 
                 logging.info(f"--- Starting {dwell_name} (x{repeat_count} repeats) ---")
 
-                lo1, lo2, rfif = set_instrument_parameters(dwell_center_freq)
-
-                if bnc1 and bnc2:
-                    bnc1.set_frequency(lo1 * 1e6)
-                    bnc1.start_output()
-                    bnc2.set_frequency(lo2 * 1e6)
-                    bnc2.start_output()
-                    logging.info(f"BNCs set to LO1={lo1}MHz, LO2={lo2}MHz.")
-                    print(f"BNCs set to LO1={lo1}MHz, LO2={lo2}MHz.")
-
-                if dio:
-                    dio.set_all_ports_rf_if_values(rfif)
-                    dio.update_digital_output()
-                    logging.info(f"DIO set for {rfif}.")
-                    print(f"DIO set for {rfif}.")
-
-                if smw200a:
-                    cal_freq = dwell_config.getint('cal_center_frequency')
-                    cal_pwr = dwell_config.getint('cal_power')
-                    smw200a.set_frequency(cal_freq * 1e6)
-                    smw200a.set_power_level(cal_pwr)
-                    smw200a.start_signal()
-                    logging.info(f"SMW200A set to {cal_freq}MHz at {cal_pwr}dBm.")
-                    print(f"SMW200A set to {cal_freq}MHz at {cal_pwr}dBm.")
+                scheduler.run_idle_tasks()  # previous dwell's last data and the retune queued for this dwell
+                if tuned_dwell != dwell_name:  # not retuned in the previous idle window, or that retune failed
+                    retune_instruments(dwell_name, dwell_config, bnc1, bnc2, dio, smw200a)
+                    tuned_dwell = dwell_name
 
                 for i in range(repeat_count):
-                    logging.info(f"Starting repeat {i + 1}/{repeat_count}...")
+                    slot, late = scheduler.wait_for_slot()
+                    logging.info(f"Starting repeat {i + 1}/{repeat_count} in slot {slot} ({late:.3f} s late)...")
                     print(f"Starting {dwell_name} repeat {i + 1}/{repeat_count}...")
 
-                    if tektronix1:
-                        ch1 = ast.literal_eval(dwell_config.get('set_channels_1'))
-                        sr1 = dwell_config.getint('sample_rate_1')
-                        rl1 = dwell_config.getint('record_length_1')
-                        tektronix1.set_channels(ch1, "ON")
-                        tektronix1.set_sample_rate(sr1)
-                        tektronix1.set_record_length(rl1)
-                        tektronix1.clipcheck(ch1)
-                        tektronix1.force_trigger()
-                        logging.info("Tektronix1 triggered.")
-                        logging.debug(f"Tektronix1 Events: {tektronix1.query('ALLEV?').strip()}")
-                        print(f"Tektronix1 Events: {tektronix1.query('ALLEV?').strip()}")
-
-                    if tektronix2:
-                        ch2 = ast.literal_eval(dwell_config.get('set_channels_2'))
-                        sr2 = dwell_config.getint('sample_rate_2')
-                        rl2 = dwell_config.getint('record_length_2')
-                        tektronix2.set_channels(ch2, "ON")
-                        tektronix2.set_sample_rate(sr2)
-                        tektronix2.set_record_length(rl2)
-                        tektronix2.clipcheck(ch2)
-                        tektronix2.force_trigger()
-                        logging.info("Tektronix2 triggered.")
-                        logging.debug(f"Tektronix2 Events: {tektronix2.query('ALLEV?').strip()}")
-                        print(f"Tektronix2 Events: {tektronix1.query('ALLEV?').strip()}")
-
-                    time.sleep(dwell_spacing)
+                    run_on_scopes(scope_pool, scopes, acquire_scope, dwell_config, monitor)
+
+                    if data_dir:
+                        scheduler.add_idle_task(run_logged, f"Data save for {dwell_name} repeat {i + 1}",
+                                                run_on_scopes, scope_pool, scopes, save_scope_data,
+                                                dwell_config, data_dir, f"{dwell_name}_r{i + 1}", ddc_bandwidth)
+
+                if dwell_index + 1 < len(dwell_sections):
+                    scheduler.add_idle_task(retune_ahead, dwell_sections[dwell_index + 1])
+                else:
+                    scheduler.run_idle_tasks()  # flush the data of the final repeat
             except Exception as e:
                 logging.error(f"An error occurred during {dwell_name}: {e}")
                 print(f"An error occurred during {dwell_name}: {e}")
@@ -323,18 +418,19 @@ def main():
     finally:
         # --- Safely shut down and clean up all initialized instruments ---
         logging.info("--- Shutting Down ---")
+        if scope_pool is not None: scope_pool.shutdown()
+        monitor.shutdown()
         input("Switch off junction box switches from right to left. Press Enter to finish...")
         print("Beginning shutdown of instruments...")
-        if smw200a is not None: smw200a.stop_signal(); smw200a.close()
-        if bnc1 is not None: bnc1.stop_output(); bnc1.close()
-        if bnc2 is not None: bnc2.stop_output(); bnc2.close()
-        if dio is not None: dio.set_all_ports_rf_if_values("ALLOFF"); dio.update_digital_output(); dio.close()
-        if tektronix1 is not None: tektronix1.close()
-        if tektronix2 is not None: tektronix2.close()
-        if ngp800 is not None: ngp800.stop_output(); ngp800.close()
+        for section in SHUTDOWN_ORDER:  # VISA sessions stay pooled for the next run
+            if instruments.get(section) is not None:
+                shutdown_instrument(section, instruments[section])
         logging.info("Cleanup complete. Program finished.")
         print("All instruments shut down. Program complete.")
 
 
 if __name__ == "__main__":
-    main()
+    if '--dry-run' in sys.argv[1:]:
+        dry_run()
+    else:
+        main()
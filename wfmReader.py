@@ -1,14 +1,152 @@
+import math
 import struct
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import io  # Import scipy for .mat file support
+
+# Header fields as (name, byte offset, struct format), decoded together by HEADER_STRUCT
+HEADER_FIELDS = [
+    ('byte_order', 0, 'H'),
+    ('version', 2, '8s'),
+    ('bps', 15, 'b'),
+    ('curve_offset', 16, 'i'),
+    ('Frames', 72, 'I'),
+    ('fastframe', 78, 'I'),
+    ('imp_dim_count', 114, 'I'),
+    ('exp_dim_count', 118, 'I'),
+    ('record_type', 122, 'I'),
+    ('summary_frame', 154, 'h'),
+    ('vscale', 168, 'd'),
+    ('voffset', 176, 'd'),
+    ('code', 240, 'i'),
+    ('exp_dim_1_type', 244, 'I'),
+    ('tscale', 488, 'd'),
+    ('tstart', 496, 'd'),
+    ('time_base_1', 768, 'I'),
+    ('tfrac', 788, 'd'),
+    ('tdatefrac', 796, 'd'),
+    ('tdate', 804, 'I'),
+    ('dpre', 822, 'I'),
+    ('dpost', 826, 'I'),
+    ('allbytes', 830, 'I'),
+]
+
+def header_struct(fields, size=838):
+    """build one struct covering the whole header, with pad bytes between the fields"""
+    fmt, position = '<', 0
+    for name, offset, code in fields:
+        fmt += f'{offset - position}x' if offset > position else ''
+        fmt += code
+        position = offset + struct.calcsize('<' + code)
+    return struct.Struct(fmt + f'{size - position}x')
+
+HEADER_STRUCT = header_struct(HEADER_FIELDS)
+HEADER_NAMES = [name for name, _, _ in HEADER_FIELDS]
 
 class WfmReadError(Exception):
     """error for unexpected things"""
     pass
 
-def read_wfm(target):
-    """return sample data from target WFM file"""
+class Waveform:
+    def __init__(self, raw, vscale, voffset, tstart, tscale, dtype='float64', frames=None):
+        """
+        Scaled view of a memory-mapped curve; samples are converted to volts only when accessed.
+
+        Args:
+            raw (numpy.memmap): Raw curve, shape (samples, frames)
+            vscale, voffset (float): Volts = raw * vscale + voffset
+            tstart, tscale (float): Time of the first sample and sample interval in seconds
+            dtype (str): Floating point type of the scaled samples, 'float64' or 'float32'
+            frames (numpy.ndarray): Frames of raw in this view, applied on each access so raw
+                stays memory-mapped; None for all of them
+        """
+        self.raw = raw
+        self.frames = frames
+        self.dtype = np.dtype(dtype)
+        self.vscale = self.dtype.type(vscale)
+        self.voffset = self.dtype.type(voffset)
+        self.tstart = tstart
+        self.tscale = tscale
+
+    @property
+    def shape(self):
+        if self.frames is None:
+            return self.raw.shape
+        return self.raw.shape[0], len(self.frames)
+
+    @property
+    def ndim(self):
+        return self.raw.ndim
+
+    def __len__(self):
+        return self.raw.shape[0]
+
+    def scale(self, raw):
+        # Convert raw samples to volts in the output dtype without a float64 intermediate
+        out = np.asarray(raw).astype(self.dtype)
+        out *= self.vscale
+        out += self.voffset
+        return out
+
+    def index(self, key):
+        # Translate an index into this view to an index into raw
+        if self.frames is None:
+            return key
+        rows, columns = (key + (slice(None),))[:2] if isinstance(key, tuple) else (key, slice(None))
+        return rows, self.frames[columns]
+
+    def __getitem__(self, key):
+        return self.scale(self.raw[self.index(key)])
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:]
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def chunks(self, chunk_size=1 << 20, frames=slice(None)):
+        """
+        Iterate over the record in blocks of samples.
+
+        Args:
+            chunk_size (int): Samples per block
+            frames: Frame index or slice to include
+
+        Yields:
+            tuple: (index of the first sample, scaled block)
+        """
+        for start in range(0, len(self), chunk_size):
+            yield start, self[start:start + chunk_size, frames]
+
+    def time(self, index=slice(None)):
+        """Sample times in seconds for an index or slice of the sample axis, computed on demand."""
+        samples = range(len(self))[index]
+        if isinstance(samples, int):
+            return self.tstart + samples * self.tscale
+        return self.tstart + np.arange(samples.start, samples.stop, samples.step) * self.tscale
+
+def frame_selection(frames, count):
+    """normalize a frame index, range, slice or index list to something that can index the frame axis"""
+    if frames is None:
+        return slice(None)
+    if isinstance(frames, range):
+        frames = slice(frames.start, frames.stop, frames.step)
+    if isinstance(frames, slice):
+        return frames
+    indices = np.atleast_1d(np.asarray(frames, dtype=np.intp))
+    if indices.ndim != 1 or np.any((indices < -count) | (indices >= count)):
+        raise ValueError(f'frame selection out of range for {count} frames: {frames}')
+    return indices % count
+
+def read_wfm(target, lazy=False, dtype='float64', frames=None, window=None):
+    """
+    return sample data from target WFM file
+
+    With lazy=True the first value is a Waveform that keeps the file memory-mapped and
+    scales samples on access, instead of a fully scaled array. dtype ('float64' or
+    'float32') sets the type of the scaled samples in both cases.
+
+    frames (an index, range, slice or list of indices) and window ((start, stop) in
+    seconds, on the same time axis as tstart) limit the read to those frames and
+    samples; only their curve bytes and timestamp records are read, and the returned
+    tstart is the time of the first sample in the window.
+    """
     with open(target, 'rb') as f:
         hbytes = f.read(838)
         meta = decode_header(hbytes)
@@ -26,62 +164,57 @@ def read_wfm(target):
             raise WfmReadError('not EXPLICIT_SAMPLE')
         if meta['time_base_1'] != 0:
             raise WfmReadError('not BASE_TIME')
-        tfrac_array = np.zeros(meta['Frames'], dtype=np.double)
-        tdatefrac_array = np.zeros(meta['Frames'], dtype=np.double)
-        tdate_array = np.zeros(meta['Frames'], dtype=np.int32)
-        tfrac_array[0] = meta['tfrac']
-        tdatefrac_array[0] = meta['tdatefrac']
-        tdate_array[0] = meta['tdate']
-        if meta['fastframe'] == 1:
-            WUSp = np.fromfile(f, dtype='i4,f8,f8,i4', count=(meta['Frames'] - 1))
-            tfrac_array[1:] = WUSp['f1']
-            tdatefrac_array[1:] = WUSp['f2']
-            tdate_array[1:] = WUSp['f3']
+        selection = frame_selection(frames, meta['Frames'])
+        frame_numbers = np.arange(meta['Frames'])[selection]
+        tfrac_array = np.zeros(len(frame_numbers), dtype=np.double)
+        tdatefrac_array = np.zeros(len(frame_numbers), dtype=np.double)
+        tdate_array = np.zeros(len(frame_numbers), dtype=np.int32)
+        # Frame 0 is timestamped in the header, the others in the WUSp records that follow it
+        first = frame_numbers == 0
+        tfrac_array[first] = meta['tfrac']
+        tdatefrac_array[first] = meta['tdatefrac']
+        tdate_array[first] = meta['tdate']
+        if meta['fastframe'] == 1 and not first.all():
+            WUSp = np.memmap(filename=f, dtype='i4,f8,f8,i4', mode='r', offset=838, shape=(meta['Frames'] - 1,))
+            WUSp = WUSp[frame_numbers[~first] - 1]
+            tfrac_array[~first] = WUSp['f1']
+            tdatefrac_array[~first] = WUSp['f2']
+            tdate_array[~first] = WUSp['f3']
         bin_wave = np.memmap(filename=f,
                              dtype=meta['dformat'],
                              mode='r',
                              offset=meta['curve_offset'],
                              shape=(meta['avilable_values'], meta['Frames']),
                              order='F')
-    bin_wave = bin_wave[meta['pre_values']:meta['avilable_values'] - meta['post_values'], :]
-    scaled_array = bin_wave * meta['vscale'] + meta['voffset']
-    return scaled_array, meta['tstart'], meta['tscale'], tfrac_array, tdatefrac_array, tdate_array
+    start = meta['pre_values']
+    stop = meta['avilable_values'] - meta['post_values']
+    tstart = meta['tstart']
+    if window is not None:
+        # Samples whose time tstart + i * tscale falls inside the window, allowing for rounding of the edges
+        num_points = stop - start
+        first_sample = min(max(math.ceil((window[0] - tstart) / meta['tscale'] - 1e-6), 0), num_points)
+        last_sample = min(max(math.floor((window[1] - tstart) / meta['tscale'] + 1e-6) + 1, first_sample), num_points)
+        start, stop = start + first_sample, start + last_sample
+        tstart += first_sample * meta['tscale']
+    if isinstance(selection, slice):
+        bin_wave, frame_index = bin_wave[start:stop, selection], None
+    else:
+        # Indexing with a list would copy every selected frame; it is applied per access instead
+        bin_wave, frame_index = bin_wave[start:stop], selection
+    waveform = Waveform(bin_wave, meta['vscale'], meta['voffset'], tstart, meta['tscale'], dtype, frame_index)
+    scaled_array = waveform if lazy else np.asarray(waveform)
+    return scaled_array, tstart, meta['tscale'], tfrac_array, tdatefrac_array, tdate_array
 
 def decode_header(header_bytes):
     """returns a dict of wfm metadata"""
-    wfm_info = {}
     if len(header_bytes) != 838:
         raise WfmReadError('wfm header bytes not 838')
-    wfm_info['byte_order'] = struct.unpack_from('H', header_bytes, offset=0)[0]
-    wfm_info['version'] = struct.unpack_from('8s', header_bytes, offset=2)[0]
-    wfm_info['imp_dim_count'] = struct.unpack_from('I', header_bytes, offset=114)[0]
-    wfm_info['exp_dim_count'] = struct.unpack_from('I', header_bytes, offset=118)[0]
-    wfm_info['record_type'] = struct.unpack_from('I', header_bytes, offset=122)[0]
-    wfm_info['exp_dim_1_type'] = struct.unpack_from('I', header_bytes, offset=244)[0]
-    wfm_info['time_base_1'] = struct.unpack_from('I', header_bytes, offset=768)[0]
-    wfm_info['fastframe'] = struct.unpack_from('I', header_bytes, offset=78)[0]
-    wfm_info['Frames'] = struct.unpack_from('I', header_bytes, offset=72)[0] + 1
-    wfm_info['summary_frame'] = struct.unpack_from('h', header_bytes, offset=154)[0]
-    wfm_info['curve_offset'] = struct.unpack_from('i', header_bytes, offset=16)[0]
-    wfm_info['vscale'] = struct.unpack_from('d', header_bytes, offset=168)[0]
-    wfm_info['voffset'] = struct.unpack_from('d', header_bytes, offset=176)[0]
-    wfm_info['tstart'] = struct.unpack_from('d', header_bytes, offset=496)[0]
-    wfm_info['tscale'] = struct.unpack_from('d', header_bytes, offset=488)[0]
-    wfm_info['tfrac'] = struct.unpack_from('d', header_bytes, offset=788)[0]
-    wfm_info['tdatefrac'] = struct.unpack_from('d', header_bytes, offset=796)[0]
-    wfm_info['tdate'] = struct.unpack_from('I', header_bytes, offset=804)[0]
-    dpre = struct.unpack_from('I', header_bytes, offset=822)[0]
-    wfm_info['dpre'] = dpre
-    dpost = struct.unpack_from('I', header_bytes, offset=826)[0]
-    wfm_info['dpost'] = dpost
+    wfm_info = dict(zip(HEADER_NAMES, HEADER_STRUCT.unpack(header_bytes)))
+    wfm_info['Frames'] += 1
+    dpre, dpost, allbytes = wfm_info['dpre'], wfm_info['dpost'], wfm_info['allbytes']
     readbytes = dpost - dpre
     wfm_info['readbytes'] = readbytes
-    allbytes = struct.unpack_from('I', header_bytes, offset=830)[0]
-    wfm_info['allbytes'] = allbytes
-    code = struct.unpack_from('i', header_bytes, offset=240)[0]
-    wfm_info['code'] = code
-    bps = struct.unpack_from('b', header_bytes, offset=15)[0]
-    wfm_info['bps'] = bps
+    code, bps = wfm_info['code'], wfm_info['bps']
     if code == 7 and bps == 1:
         dformat = 'int8'
         samples = readbytes
@@ -101,14 +234,18 @@ def decode_header(header_bytes):
     return wfm_info
 
 if __name__ == "__main__":
+    # Plotting and .mat support are only needed by this example, header decoding does not load them
+    import matplotlib.pyplot as plt
+    from scipy import io  # Import scipy for .mat file support
+
     target_file = r"C:\Users\catnip\Documents\GitHub\UCSD-WTR-Array\Test Files\Tek001_ch8.wfm"
 
     try:
-        scaled_array, tstart, tscale, tfrac_array, tdatefrac_array, tdate_array = read_wfm(target_file)
+        waveform, tstart, tscale, tfrac_array, tdatefrac_array, tdate_array = read_wfm(target_file, lazy=True)
 
         # Save waveform data to .mat file
         mat_data = {
-            'scaled_array': scaled_array,
+            'scaled_array': np.asarray(waveform),
             'tstart': tstart,
             'tscale': tscale,
             'tfrac_array': tfrac_array,
@@ -118,11 +255,8 @@ if __name__ == "__main__":
         io.savemat(r"C:\Users\catnip\Documents\GitHub\UCSD-WTR-Array\Test Files\Tek001_ch8.mat", mat_data)
 
         # Optional: Plotting example
-        num_points = scaled_array.shape[0]
-        time_values = np.linspace(tstart, tstart + num_points * tscale, num_points, endpoint=False)
-
         plt.figure(figsize=(10, 6))
-        plt.plot(time_values, scaled_array, label='Waveform Data')
+        plt.plot(waveform.time(), waveform[:], label='Waveform Data')
         plt.xlabel('Time')
         plt.ylabel('Voltage')
         plt.title('Voltage vs. Time')